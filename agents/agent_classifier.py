@@ -0,0 +1,242 @@
+"""Local, zero-LLM agent selection.
+
+Classifiers guess which agent should handle an issue from its text and say
+how sure they are. AgentRouter asks them in order and only falls back to
+the LLM router when none is confident enough, so most issues are routed
+in well under a millisecond instead of a chat-completion round trip.
+
+- KeywordClassifier: hand-written regex rules, e.g. "break this down into
+  sub-issues" -> issue_creator.
+- NaiveBayesClassifier: a multinomial naive Bayes model trained on the
+  routing decisions in a RoutingLog, and kept learning from new ones. It
+  is only trusted while its measured accuracy on them is high enough.
+
+A fraction of the issues a classifier is sure about still goes to the LLM
+router (`explore_rate`), so the classifiers keep receiving fresh labels.
+
+Example usage:
+
+    routing_log = RoutingLog("routing.jsonl")
+    router = AgentRouter(
+        classifiers=[KeywordClassifier(), NaiveBayesClassifier.from_log(routing_log)],
+        classifier_threshold=0.75,
+        explore_rate=0.1,
+        routing_log=routing_log,
+    )
+"""
+import json
+import logging
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict, deque
+from itertools import islice
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+from linear_types import Issue
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def issue_text(issue: Issue) -> str:
+    return f"{issue.title or ''}\n{issue.description or ''}"
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class Prediction(NamedTuple):
+    agent: str
+    confidence: float
+
+
+class AgentClassifier(ABC):
+    """Base class: classify() returns a Prediction, or None to abstain."""
+
+    name = "classifier"
+
+    @abstractmethod
+    def classify(self, issue: Issue) -> Optional[Prediction]:
+        ...
+
+    def learn(self, issue: Issue, agent: str):
+        """Called with each routing decision made without this classifier."""
+
+
+class Rule(NamedTuple):
+    agent: str
+    pattern: Pattern
+    weight: float = 1.0
+
+
+DEFAULT_RULES = [
+    Rule(
+        "issue_creator",
+        re.compile(
+            r"\b(?:break(?:ing)? (?:it |this |that )?down|sub-?issues?|sub-?tasks?"
+            r"|split (?:it |this )?(?:up|into)|create (?:the )?(?:issues|tickets|tasks))\b",
+            re.I,
+        ),
+        2.0,
+    ),
+    Rule(
+        "issue_creator",
+        re.compile(
+            r"\b(?:spec(?:ced|'d)? out|flesh(?:ed)? out|scope out|needs? (?:more )?(?:definition|detail))",
+            re.I,
+        ),
+    ),
+    Rule("GPT4", re.compile(r"\bacceptance criteria\b", re.I), 2.0),
+    # Three or more list items: the issue is already specified.
+    Rule("GPT4", re.compile(r"(?:^[ \t]*(?:[-*]|\d+\.)[ \t].*(?:\n|$)){3,}", re.M)),
+    Rule("GPT35", re.compile(r"\b(?:typo|rename|reword|rephrase|summari[sz]e|translate)\b", re.I)),
+]
+
+
+class KeywordClassifier(AgentClassifier):
+    """Scores agents by weighted regex rules.
+
+    Each rule counts at most twice. The confidence is the best agent's
+    score over the total plus `prior`, so one weak match, or rules pointing
+    at different agents, stay below a sensible threshold.
+    """
+
+    name = "keywords"
+
+    def __init__(self, rules: Sequence[Rule] = DEFAULT_RULES, prior: float = 0.5):
+        self.rules = list(rules)
+        self.prior = prior
+
+    def classify(self, issue: Issue) -> Optional[Prediction]:
+        text = issue_text(issue)
+        scores: Dict[str, float] = defaultdict(float)
+        for rule in self.rules:
+            matches = sum(1 for _ in islice(rule.pattern.finditer(text), 2))
+            if matches:
+                scores[rule.agent] += rule.weight * matches
+        if not scores:
+            return None
+        agent, best = max(scores.items(), key=lambda item: item[1])
+        return Prediction(agent, best / (sum(scores.values()) + self.prior))
+
+
+class NaiveBayesClassifier(AgentClassifier):
+    """Multinomial naive Bayes over the words of an issue.
+
+    Raw naive Bayes posteriors grow more extreme with every word, so the
+    confidence is computed from the mean per-word log-likelihood instead,
+    which does not depend on the issue's length.
+
+    The model is only trusted once it has proven itself: every decision it
+    learns from is first predicted as an unseen example, and it abstains
+    until at least `min_examples` such predictions were made and the last
+    `accuracy_window` of them were at least `min_accuracy` right.
+    """
+
+    name = "naive_bayes"
+
+    def __init__(
+        self,
+        alpha: float = 1.0,
+        min_examples: int = 20,
+        min_accuracy: float = 0.9,
+        accuracy_window: int = 200,
+    ):
+        self.alpha = alpha
+        self.min_examples = min_examples
+        self.min_accuracy = min_accuracy
+        self.examples: Counter = Counter()
+        self.word_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.total_words: Counter = Counter()
+        self.vocabulary: set = set()
+        # Whether held-out predictions were right, most recent last.
+        self.outcomes: Deque[bool] = deque(maxlen=accuracy_window)
+
+    @classmethod
+    def from_log(cls, routing_log: "RoutingLog", **kwargs) -> "NaiveBayesClassifier":
+        classifier = cls(**kwargs)
+        classifier.fit(routing_log.examples())
+        return classifier
+
+    def fit(self, examples: Iterable[Tuple[str, str]]):
+        """Trains on (issue text, agent) pairs, in order."""
+        for text, agent in examples:
+            self.add(text, agent)
+
+    def add(self, text: str, agent: str):
+        words = tokenize(text)
+        if len(self.examples) >= 2:
+            predicted = self._predict(words)
+            if predicted is not None:
+                self.outcomes.append(predicted.agent == agent)
+        self.examples[agent] += 1
+        self.word_counts[agent].update(words)
+        self.total_words[agent] += len(words)
+        self.vocabulary.update(words)
+
+    def learn(self, issue: Issue, agent: str):
+        self.add(issue_text(issue), agent)
+
+    @property
+    def accuracy(self) -> Optional[float]:
+        """Accuracy of the recent held-out predictions, if there were any."""
+        if not self.outcomes:
+            return None
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def _predict(self, words: List[str]) -> Optional[Prediction]:
+        if not words:
+            return None
+        total = sum(self.examples.values())
+        vocabulary_size = len(self.vocabulary)
+        scores = {}
+        for agent, count in self.examples.items():
+            counts = self.word_counts[agent]
+            denominator = math.log(self.total_words[agent] + self.alpha * vocabulary_size)
+            log_likelihood = sum(math.log(counts[word] + self.alpha) - denominator for word in words)
+            scores[agent] = math.log(count / total) + log_likelihood / len(words)
+        best_agent = max(scores, key=scores.get)
+        best = scores[best_agent]
+        normalizer = sum(math.exp(value - best) for value in scores.values())
+        return Prediction(best_agent, 1.0 / normalizer)
+
+    def classify(self, issue: Issue) -> Optional[Prediction]:
+        accuracy = self.accuracy
+        if (
+            len(self.outcomes) < min(self.min_examples, self.outcomes.maxlen)
+            or accuracy is None
+            or accuracy < self.min_accuracy
+        ):
+            return None
+        return self._predict(tokenize(issue_text(issue)))
+
+
+class RoutingLog:
+    """An append-only JSON-lines file of routing decisions, the training
+    data for NaiveBayesClassifier."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def record(self, issue: Issue, agent: str, source: str):
+        entry = {"text": issue_text(issue), "agent": agent, "source": source}
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError:
+            logger.warning("could not write the routing log", exc_info=True)
+
+    def examples(self) -> Iterator[Tuple[str, str]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    yield entry["text"], entry["agent"]
+                except (ValueError, KeyError):
+                    continue
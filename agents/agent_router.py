@@ -1,4 +1,7 @@
 import json
+import logging
+import random
+from typing import Optional, Sequence
 
 from linear_types import Issue
 from linear_types import IssueLabelConnection
@@ -6,6 +9,12 @@ from linear_types import IssueLabelConnection
 from agents.gpt_3 import GPT35
 from agents.gpt_4 import GPT4
 from agents.gpt_4 import issue_creator
+from agents.agent_classifier import AgentClassifier, Prediction, RoutingLog
+from agents.llm_cache import cached_arun
+from agents.llm_dispatcher import BULK, INTERACTIVE, ROUTING
+from agents.llm_metrics import track_llm
+import metrics
+import tracing
 
 from langchain.llms import OpenAI
 from langchain.chat_models import ChatOpenAI
@@ -26,6 +35,102 @@ AGENTS = [
     # baby_agi_agent,
 ]
 
+logger = logging.getLogger(__name__)
+
+ROUTING_DECISIONS = metrics.counter(
+    "agent_routing_total", "Agent selections, by what made them.", ["source"]
+)
+
+
+def _dedent(template: str) -> str:
+    return "\n".join([line.strip() for line in template.splitlines()])
+
+
+ROUTER_TEMPLATE = _dedent("""You are a helpful assistant that chooses the next agent to best handle a task.
+        Your answer must be JSON formatted and contain the name of the agent to use and the input string 
+        to pass to the agent. You must include these two fields in your response: 'agent' and 'rationale'.
+        If an issue contains an "Agent:<agent name>" label then that should force the use of that agent.
+        The agent should also include a rationale for why it chose that agent and why it didn't choose the others.
+
+        Available agents: {agents}
+        """)
+
+ROUTER_SHORT_TEMPLATE = """
+        You are a task assignment AI that has been given this task:
+        {task}
+
+        You should not attempt the task. Instead, you should assign the task to one of the following agents:
+        {agents}
+
+        which agent would you like to assign it to? Please give your reasoning.
+        For your final answer, please wrap the name of the agent you would like to choose in square brackets.
+
+        For example: [agent_name]
+
+        Your Response:
+        """
+
+COMMENT_TEMPLATE = """
+        You are a helpful project management AI that is responding to a new comment on a task.
+        {issue}
+
+        The first line of your response should begin with "COMMENT:" followed by the comment to respond with - please explain your reasoning.
+
+        Finally, if the comment is asking to improve the issue description, please add a new line beginning with "ΔDESCRIPTION:" followed by the improvement. If you have no improvements to suggest, please add a new line beginning with "ΔDESCRIPTION: none".
+        """
+
+EVALUATOR_TEMPLATE = """You are a task evaluation agent. Your job is to consider the following issue and 
+        attempt to either complete it or determine it cannot be completed:
+        {task}
+
+        The following work has been done on this issue:
+        {past_issues}
+
+        Given the work done on this issue, consider if it can be completed.
+        If it can be completed then please compile the results of the work done and complete 
+        any remaining work. If it cannot be completed then please explain why it cannot be 
+        completed and include not completed in square brackets, like so: [not completed].
+
+        Your Response:
+        """
+
+
+def _few_shot_examples() -> dict:
+    """Few-shot examples for agent selection given a task, serialized once."""
+    example_issue1 = Issue( id="1",
+        title="spec out the forgot password screen",
+        description="the forgot password screen needs to be spec'd out so that we can implement it.",
+    )
+    example_issue2 = Issue( id="1",
+        title="spec out the forgot password screen",
+        description="""Acceptance Criteria:
+* The forgot password screen should have a field for the user to enter their email address.
+* The forgot password screen should have a button to submit the email address.
+* The forgot password screen should have a button to cancel the forgot password process.
+* The forgot password screen should have a link to the login screen.
+* The forgot password screen should have a link to the sign up screen.""",
+    )
+    example_issue3 = Issue( id="1",
+        title="spec out the forgot password screen",
+        description=example_issue2.description,
+        labels=IssueLabelConnection(nodes=[{"name": "Agent:GPT3.5"}]),
+    )
+    return {
+        "example_issue1": json.dumps(example_issue1.dict(exclude={"id"})),
+        "example_issue2": json.dumps(example_issue2.dict(exclude={"id"})),
+        "example_issue3": json.dumps(example_issue3.dict(exclude={"id"})),
+        "example_ai_response1": json.dumps({"agent": "issue_creator",
+            "rationale": "This issue seems like it needs more definition, so we assign it \
+                    to the agent that can break issues down into smaller issues.",}),
+        "example_ai_response2": json.dumps({ "agent": "GPT4",
+            "rationale": "This issue appears ready to complete (it already has enough detail).", }),
+        "example_ai_response3": json.dumps( { "agent": "GPT35",
+            "rationale": "GPT35 was specifically requested for this issue via a label", }),
+    }
+
+
+FEW_SHOT_EXAMPLES = _few_shot_examples()
+
 
 class AgentRouter:
     """
@@ -50,52 +155,33 @@ class AgentRouter:
         print(router.run(input_str, "agent2"))  # Output: hello, world!
     """
 
-    def __init__(self, agents=AGENTS, verbose=False, agent_kwargs=None):
+    def __init__(
+        self,
+        agents=AGENTS,
+        verbose=False,
+        agent_kwargs=None,
+        classifiers: Sequence[AgentClassifier] = (),
+        classifier_threshold: float = 0.75,
+        explore_rate: float = 0.1,
+        routing_log: Optional[RoutingLog] = None,
+    ):
         """
         Initializes the AgentRouter with a list of agent functions.
 
         Args:
             agents (list): A list of functions that expect a string input and have a string output.
+            classifiers (list): Local classifiers tried, in order, before the LLM router.
+            classifier_threshold (float): The confidence a classifier needs to be trusted.
+            explore_rate (float): The fraction of classified issues still routed by the LLM,
+                so the classifiers keep learning and their accuracy stays measured.
+            routing_log (RoutingLog): Where label and LLM routing decisions are recorded.
         """
         self.agents = {}
         self.agent_kwargs = agent_kwargs or {}
-
-        self.llm = ChatOpenAI(temperature=0.0)
-
-
-        template = """You are a helpful assistant that chooses the next agent to best handle a task.
-        Your answer must be JSON formatted and contain the name of the agent to use and the input string 
-        to pass to the agent. You must include these two fields in your response: 'agent' and 'rationale'.
-        If an issue contains an "Agent:<agent name>" label then that should force the use of that agent.
-        The agent should also include a rationale for why it chose that agent and why it didn't choose the others.
-
-        Available agents: {agents}
-        """
-        # de-indent
-        template = "\n".join([line.strip() for line in template.splitlines()])
-        system_message_prompt = SystemMessagePromptTemplate.from_template(template)
-        example_human1 = HumanMessagePromptTemplate.from_template("{example_issue1}")
-        example_human2 = HumanMessagePromptTemplate.from_template("{example_issue2}")
-        example_human3 = HumanMessagePromptTemplate.from_template("{example_issue3}")
-        example_ai1 = AIMessagePromptTemplate.from_template("{example_ai_response1}")
-        example_ai2 = AIMessagePromptTemplate.from_template("{example_ai_response2}")
-        example_ai3 = AIMessagePromptTemplate.from_template("{example_ai_response3}")
-        human_template = "{input_issue}"
-        human_message_prompt = HumanMessagePromptTemplate.from_template(human_template)
-
-        chat_prompt = ChatPromptTemplate.from_messages(
-            [
-                system_message_prompt,
-                example_human1,
-                example_human2,
-                example_human3,
-                example_ai1,
-                example_ai2,
-                example_ai3,
-                human_message_prompt,
-            ]
-        )
-        self.chain = LLMChain(llm=self.llm, prompt=chat_prompt, verbose=True)
+        self.classifiers = list(classifiers)
+        self.classifier_threshold = classifier_threshold
+        self.explore_rate = explore_rate
+        self.routing_log = routing_log
 
         for agent in agents:
             self.agents[agent.__name__] = {
@@ -103,69 +189,123 @@ class AgentRouter:
                 "function": agent,
                 "description": agent.__doc__,
             }
-            print(f"Loaded agent: {agent.__name__}")
+            logger.debug("loaded agent %s", agent.__name__)
+
+        self.llm = ChatOpenAI(temperature=0.0)
+        # Shared by the completion-style prompts below.
+        self.completion_llm = OpenAI(temperature=0.9, model_name="gpt-4")
+
+        chat_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(ROUTER_TEMPLATE),
+                HumanMessagePromptTemplate.from_template("{example_issue1}"),
+                HumanMessagePromptTemplate.from_template("{example_issue2}"),
+                HumanMessagePromptTemplate.from_template("{example_issue3}"),
+                AIMessagePromptTemplate.from_template("{example_ai_response1}"),
+                AIMessagePromptTemplate.from_template("{example_ai_response2}"),
+                AIMessagePromptTemplate.from_template("{example_ai_response3}"),
+                HumanMessagePromptTemplate.from_template("{input_issue}"),
+            ]
+        )
+        # Every prompt the router runs, built once and keyed by prompt name.
+        self.chains = {
+            "router": LLMChain(llm=self.llm, prompt=chat_prompt, verbose=verbose),
+            "router_short": LLMChain(
+                llm=self.completion_llm,
+                prompt=PromptTemplate(input_variables=["task", "agents"], template=ROUTER_SHORT_TEMPLATE),
+                verbose=verbose,
+            ),
+            "comment": LLMChain(
+                llm=self.completion_llm,
+                prompt=PromptTemplate(input_variables=["issue"], template=COMMENT_TEMPLATE),
+                verbose=verbose,
+            ),
+            "evaluator": LLMChain(
+                llm=self.completion_llm,
+                prompt=PromptTemplate(input_variables=["task", "past_issues"], template=EVALUATOR_TEMPLATE),
+                verbose=verbose,
+            ),
+        }
+
+        # The parts of the router prompts that only depend on the agents.
+        self.router_inputs = {
+            "agents": json.dumps(
+                {agent_name: agent["description"] for agent_name, agent in self.agents.items()}
+            ),
+            **FEW_SHOT_EXAMPLES,
+        }
+        self.formatted_agents = "\n".join(
+            [f"{agent['name']}: {agent['description']},\n" for agent in self.agents.values()]
+        )
 
     async def agent_for_issue(self, issue: Issue) -> str:
         """Determines the appropriate agent to accomplish the given issue and hands it off to the agent.
 
         If the issue contains an "Agent:<agent name>" label then we should short circuit and use that agent.
         """
+        with tracing.span("AgentRouter.agent_for_issue", **{"issue.id": issue.id}) as span:
+            agent_name = await self._agent_for_issue(issue)
+            span.set_attribute("agent.name", agent_name)
+            return agent_name
 
+    async def _agent_for_issue(self, issue: Issue) -> str:
         model_from_labels = self.model_from_labels(issue.labels)
         if model_from_labels:
+            self.record_decision(issue, model_from_labels, "label")
             return model_from_labels
 
-        # Few-shot examples for agent selection given a task.
-
-        example_issue1 = Issue( id="1",
-            title="spec out the forgot password screen",
-            description="the forgot password screen needs to be spec'd out so that we can implement it.",
-        )
-        example_issue2 = Issue( id="1",
-            title="spec out the forgot password screen",
-            description="""Acceptance Criteria:
-* The forgot password screen should have a field for the user to enter their email address.
-* The forgot password screen should have a button to submit the email address.
-* The forgot password screen should have a button to cancel the forgot password process.
-* The forgot password screen should have a link to the login screen.
-* The forgot password screen should have a link to the sign up screen.""",
-        )
-        example_issue3 = Issue( id="1",
-            title="spec out the forgot password screen",
-            description=example_issue2.description,
-            labels=IssueLabelConnection(nodes=[{"name": "Agent:GPT3.5"}]),
-        )
-        example_ai_response1 = json.dumps({"agent": "issue_creator",
-                "rationale": "This issue seems like it needs more definition, so we assign it \
-                        to the agent that can break issues down into smaller issues.",})
-        example_ai_response2 = json.dumps({ "agent": "GPT4",
-                "rationale": "This issue appears ready to complete (it already has enough detail).", })
-        example_ai_response3 = json.dumps( { "agent": "GPT35",
-                "rationale": "GPT35 was specifically requested for this issue via a label", })
-        output = await self.chain.arun(
-            {
-                "agents": json.dumps(
-                    {
-                        agent_name: agent["description"]
-                        for agent_name, agent in self.agents.items()
-                    }
-                ),
-                "example_issue1": json.dumps(example_issue1.dict(exclude={"id"})),
-                "example_issue2": json.dumps(example_issue2.dict(exclude={"id"})),
-                "example_issue3": json.dumps(example_issue3.dict(exclude={"id"})),
-                "example_ai_response1": example_ai_response1,
-                "example_ai_response2": example_ai_response2,
-                "example_ai_response3": example_ai_response3,
-                "input_issue": json.dumps(issue.dict(exclude={"id"})),
-            }
-        )
+        prediction = self.classify(issue)
+        if prediction is not None:
+            if random.random() >= self.explore_rate:
+                ROUTING_DECISIONS.inc(source="classifier")
+                return prediction.agent
+            logger.debug("routing a classified issue with the LLM", extra={"agent": prediction.agent})
+
+        with track_llm("router"):
+            output = await cached_arun(
+                self.chains["router"],
+                {**self.router_inputs, "input_issue": json.dumps(issue.dict(exclude={"id"}))},
+                priority=ROUTING,
+            )
         try:
             result = json.loads(output)
-            print(f"Agent response: {result}")
-            return result.get("agent", "GPT4")
+            logger.info("agent selected", extra={"completion": result})
+            agent_name = result.get("agent", "GPT4")
         except Exception as e:
-            print(f"Error parsing agent response: {e}")
+            logger.warning("could not parse the agent selection: %s", e)
+            ROUTING_DECISIONS.inc(source="default")
             return "GPT4"
+        self.record_decision(issue, agent_name, "llm")
+        return agent_name
+
+    def classify(self, issue: Issue) -> Optional[Prediction]:
+        """Returns the first local prediction confident enough to skip the
+        LLM router, if any."""
+        for classifier in self.classifiers:
+            prediction = classifier.classify(issue)
+            if prediction is None or prediction.agent not in self.agents:
+                continue
+            logger.debug(
+                "agent classified",
+                extra={
+                    "classifier": classifier.name,
+                    "agent": prediction.agent,
+                    "confidence": round(prediction.confidence, 3),
+                },
+            )
+            if prediction.confidence >= self.classifier_threshold:
+                return prediction
+        return None
+
+    def record_decision(self, issue: Issue, agent_name: str, source: str):
+        """Feeds a label or LLM routing decision to the classifiers."""
+        ROUTING_DECISIONS.inc(source=source)
+        if agent_name not in self.agents:
+            return
+        for classifier in self.classifiers:
+            classifier.learn(issue, agent_name)
+        if self.routing_log is not None:
+            self.routing_log.record(issue, agent_name, source)
 
     def model_from_labels(self, labels: IssueLabelConnection) -> str:
         """Determines the appropriate agent to accomplish the given issue and hands it off to the agent.
@@ -180,49 +320,38 @@ class AgentRouter:
                     agent_name = agent_name.replace("-", "")
                     agent_name = agent_name.replace(".", "")
         if agent_name not in self.agents:
-            print(f"warning: Agent from explicit label not found: {agent_name}")
+            logger.warning("agent from explicit label not found: %s", agent_name)
             return None
         return agent_name
 
-    async def accomplish_issue(self, issue: Issue):
-        """Determines the appropriate agent to accomplish the given issue and hands it off to the agent."""
+    async def accomplish_issue(self, issue: Issue, stream=None):
+        """Determines the appropriate agent to accomplish the given issue and hands it off to the agent.
+
+        Agents that support it write their output to `stream` as it is generated.
+        """
         agent = await self.agent_for_issue(issue)
-        return await self.run(issue, agent)
+        return await self.run(issue, agent, stream=stream)
 
+    @tracing.traced("AgentRouter.handle_new_comment")
     async def handle_new_comment(self, issue: Issue):
         """Handles a new comment on an issue."""
-        print("handling new comment")
-        #self.agent_kwargs.get("linear_client")
-
-        template = """
-        You are a helpful project management AI that is responding to a new comment on a task.
-        {issue}
-
-        The first line of your response should begin with "COMMENT:" followed by the comment to respond with - please explain your reasoning.
-
-        Finally, if the comment is asking to improve the issue description, please add a new line beginning with "ΔDESCRIPTION:" followed by the improvement. If you have no improvements to suggest, please add a new line beginning with "ΔDESCRIPTION: none".
-        """
-        llm = OpenAI(temperature=0.9, model_name="gpt-4")
-
-        SystemMessagePromptTemplate.from_template(template)
-        prompt = PromptTemplate(
-            input_variables=["issue"],
-            template=template,
-        )
-
-        from langchain.chains import LLMChain
-        chain = LLMChain(llm=llm, prompt=prompt, verbose=True)
-
-        chain_run = await chain.arun({"issue": json.dumps(issue.dict(exclude_unset=True, exclude_none=True))})
+        logger.info("handling new comment", extra={"issue_id": issue.id})
+        with track_llm("comment"):
+            chain_run = await cached_arun(
+                self.chains["comment"],
+                {"issue": json.dumps(issue.dict(exclude_unset=True, exclude_none=True))},
+                priority=INTERACTIVE,
+            )
         return chain_run
 
-    async def run(self, issue: Issue, agent_name: str):
+    async def run(self, issue: Issue, agent_name: str, stream=None):
         """
         Takes an input string and an agent name, and runs the input string through the chosen agent function.
 
         Args:
             issue (Issue): The input string to be processed.
             agent_name (str): The name of the agent function to process the input string.
+            stream (ThrottledWriter): Optional progressive output, for agents that stream.
 
         Returns:
             str: The output of the chosen agent function.
@@ -231,8 +360,13 @@ class AgentRouter:
             ValueError: If no agent is found with the given name.
         """
         if agent_name in self.agents:
-            self.agents[agent_name]["function"]
-            return await self.agents[agent_name]["function"](issue, **self.agent_kwargs)
+            with tracing.span(
+                "AgentRouter.run", **{"issue.id": issue.id, "agent.name": agent_name}
+            ), track_llm(agent_name):
+                kwargs = dict(self.agent_kwargs)
+                if stream is not None:
+                    kwargs["stream"] = stream
+                return await self.agents[agent_name]["function"](issue, **kwargs)
         else:
             raise ValueError(f"No agent found with name: {agent_name}")
 
@@ -245,86 +379,40 @@ class AgentRouter:
         """
         return [(name, agent["description"]) for name, agent in self.agents.items()]
 
-    def agent_for_issue_short(self, issue: Issue):
+    async def agent_for_issue_short(self, issue: Issue):
         """Determines the appropriate agent to accomplish the given issue."""
 
-        template = """
-        You are a task assignment AI that has been given this task:
-        {task}
-
-        You should not attempt the task. Instead, you should assign the task to one of the following agents:
-        {agents}
-
-        which agent would you like to assign it to? Please give your reasoning.
-        For your final answer, please wrap the name of the agent you would like to choose in square brackets.
-
-        For example: [agent_name]
-
-        Your Response:
-        """
-        llm = OpenAI(temperature=0.9, model_name="gpt-4")
-        agents = self.agents
-
-        prompt = PromptTemplate(
-            input_variables=["task", "agents"],
-            template=template,
-        )
-
-        from langchain.chains import LLMChain
-
-        chain = LLMChain(llm=llm, prompt=prompt)
-
-        formatted_agents = "\n".join(
-            [f"{agents[a]['name']}: {agents[a]['description']},\n" for a in agents]
-        )
         issue_description = issue.title + "\n\n" + issue.description
 
         # chain_run = chain.run({"task": issue, "summary": get_project_summary(issue)})
-        chain_run = chain.run({"task": issue_description, "agents": formatted_agents})
-
-        print(chain_run)
+        with track_llm("router"):
+            chain_run = await cached_arun(
+                self.chains["router_short"],
+                {"task": issue_description, "agents": self.formatted_agents},
+                priority=ROUTING,
+            )
+        logger.debug("agent selection", extra={"completion": chain_run})
 
-        for agent_name in agents.keys():
+        for agent_name in self.agents:
             if f"[{agent_name}]" in chain_run:
                 return agent_name
 
         return False
 
+    @tracing.traced("AgentRouter.evaluate_issue_completion")
     async def evaluate_issue_completion(self, issue: Issue, past_issues):
         """Determines whether a given issue has been completed"""
 
-        template = """You are a task evaluation agent. Your job is to consider the following issue and 
-        attempt to either complete it or determine it cannot be completed:
-        {task}
-
-        The following work has been done on this issue:
-        {past_issues}
-
-        Given the work done on this issue, consider if it can be completed.
-        If it can be completed then please compile the results of the work done and complete 
-        any remaining work. If it cannot be completed then please explain why it cannot be 
-        completed and include not completed in square brackets, like so: [not completed].
-
-        Your Response:
-        """
-        llm = OpenAI(temperature=0.9, model_name="gpt-4")
-
-        prompt = PromptTemplate(
-            input_variables=["task", "past_issues"],
-            template=template,
-        )
-
-        from langchain.chains import LLMChain
-
-        chain = LLMChain(llm=llm, prompt=prompt)
-
-        chain_run = await chain.arun(
-            {
-                "task": issue.dict(include={"title","description"}),
-                "past_issues": past_issues,
-             }
-        )
-        print(chain_run)
+        with track_llm("evaluator"):
+            chain_run = await cached_arun(
+                self.chains["evaluator"],
+                {
+                    "task": issue.dict(include={"title","description"}),
+                    "past_issues": past_issues,
+                 },
+                priority=BULK,
+            )
+        logger.debug("issue evaluation", extra={"completion": chain_run})
         # TODO: come eup with a better way to connect this output to the issue
         if "[not completed]" in chain_run.lower():
             # issue.description = (
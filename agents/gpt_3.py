@@ -1,12 +1,16 @@
 from langchain.llms import OpenAI
 from langchain.prompts import PromptTemplate
 from linear_types import Issue
+from agents.llm_cache import cached_arun
+import tracing
 
 
 llm = OpenAI(temperature=0.9, model_name="gpt-3.5-turbo")
+streaming_llm = OpenAI(temperature=0.9, model_name="gpt-3.5-turbo", streaming=True)
 
 
-async def GPT35(issue: Issue, **kwargs):
+@tracing.traced("agent GPT35")
+async def GPT35(issue: Issue, stream=None, **kwargs):
     """Uses GPT-3.5 to accomplish an issue. Fast but leess powerful. Does not use any tools."""
     template = """
     You have been given this task:
@@ -24,7 +28,13 @@ async def GPT35(issue: Issue, **kwargs):
 
     from langchain.chains import LLMChain
 
-    chain = LLMChain(llm=llm, prompt=prompt)
+    # With a stream (agents.streaming.ThrottledWriter) the output is also
+    # written progressively as the tokens arrive.
+    chain = LLMChain(llm=streaming_llm if stream else llm, prompt=prompt)
     # chain_run = chain.run({"task": issue, "summary": get_project_summary(issue)})
-    r = await chain.arun({"task": issue.dict(include={"title", "description"})})
+    r = await cached_arun(
+        chain,
+        {"task": issue.dict(include={"title", "description"})},
+        callbacks=[stream] if stream else None,
+    )
     return r
@@ -1,13 +1,21 @@
 from langchain.llms import OpenAI
 from langchain.prompts import PromptTemplate
 from linear_types import Issue
+from agents.llm_cache import cached_arun
+from agents.llm_dispatcher import BULK
+import tracing
 from linear_client import IssueInput
 import re
 import json
+import logging
 
 
+logger = logging.getLogger(__name__)
+
 llm = OpenAI(temperature=0.0, model_name="gpt-4")
+streaming_llm = OpenAI(temperature=0.0, model_name="gpt-4", streaming=True)
 
+@tracing.traced("agent issue_evaluator")
 async def issue_evaluator(issue: Issue, **kwargs):
     """Evaluates an issue and returns whether it is done or not."""
     template = """
@@ -26,8 +34,9 @@ async def issue_evaluator(issue: Issue, **kwargs):
     from langchain.chains import LLMChain
     chain = LLMChain(llm=llm, prompt=prompt)
     # chain_run = chain.run({"task": issue, "summary": get_project_summary(issue)})
-    return await chain.arun({"issue": issue.dict()})
+    return await cached_arun(chain, {"issue": issue.dict()}, priority=BULK)
 
+@tracing.traced("agent issue_creator")
 async def issue_creator(issue: Issue, linear_client=None, **kwargs):
     """Creates new sub-issues for the provided issue."""
     template = """
@@ -64,7 +73,7 @@ async def issue_creator(issue: Issue, linear_client=None, **kwargs):
     current_child_issues = []
 
     # result = canned_result
-    result = await chain.arun({
+    result = await cached_arun(chain, {
         "issue": issue.dict(),
         "siblings": json.dumps(sibling_issues),
         "current_child_tasks": json.dumps(current_child_issues),
@@ -74,8 +83,7 @@ async def issue_creator(issue: Issue, linear_client=None, **kwargs):
     extracted = regexp.search(result).group(1)
     parsed = json.loads(extracted)
 
-    print(extracted)
-    print(parsed)
+    logger.debug("sub-issues", extra={"completion": parsed})
     parent_issue = issue
 
     for issue in parsed:
@@ -89,11 +97,12 @@ async def issue_creator(issue: Issue, linear_client=None, **kwargs):
         if linear_client is not None:
             await linear_client.create_issue(input)
         else:
-            print("missing linear client")
+            logger.warning("missing linear client, sub-issue not created")
         # todo: assign to bot
     return parent_issue.description
 
-async def GPT4(issue: Issue, **kwargs):
+@tracing.traced("agent GPT4")
+async def GPT4(issue: Issue, stream=None, **kwargs):
     """Uses GPT-4 to accomplish an issue. Powerful but slower. Does not use any tools."""
     template = """
     You have been given this task:
@@ -111,6 +120,12 @@ async def GPT4(issue: Issue, **kwargs):
 
     from langchain.chains import LLMChain
 
-    chain = LLMChain(llm=llm, prompt=prompt)
+    # With a stream (agents.streaming.ThrottledWriter) the output is also
+    # written progressively as the tokens arrive.
+    chain = LLMChain(llm=streaming_llm if stream else llm, prompt=prompt)
     # chain_run = chain.run({"task": issue, "summary": get_project_summary(issue)})
-    return await chain.arun({"task": issue.dict(include={"title", "description"})})
+    return await cached_arun(
+        chain,
+        {"task": issue.dict(include={"title", "description"})},
+        callbacks=[stream] if stream else None,
+    )
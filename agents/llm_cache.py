@@ -0,0 +1,179 @@
+"""A persistent, content-addressed cache of deterministic LLM calls.
+
+Redelivered webhooks and repeated evaluations send byte-identical prompts.
+For chains whose LLM runs at temperature 0 the completion is a function of
+the model parameters and the rendered prompt, so `cached_arun` keys it by a
+hash of both and answers repeats from SQLite. Calls at any other
+temperature always reach the model.
+
+Entries expire after `ttl` seconds and the least recently used ones are
+evicted beyond `max_entries`. Inside `bypass_llm_cache()`, e.g. for a
+request sent with `X-LLM-Cache: bypass`, the cache is not read, but fresh
+completions still replace what it holds. Jobs enqueued inside the block
+keep bypassing the cache when the job queue propagates `bypass_var`.
+
+SQLite calls block, so the cache runs them on its own thread.
+
+Example usage:
+
+    configure_llm_cache("llm_cache.sqlite3", ttl=7 * 24 * 3600, max_entries=10000)
+    output = await cached_arun(chain, {"issue": issue.dict()})
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from agents.llm_dispatcher import AGENT, dispatch_arun
+import metrics
+
+BYPASS_HEADER = "x-llm-cache"
+
+LLM_CACHE_LOOKUPS = metrics.counter(
+    "llm_cache_lookups_total", "LLM cache lookups for temperature 0 calls.", ["result"]
+)
+
+bypass_var: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: str = "llm_cache.sqlite3",
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        prune_every: int = 100,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._writes = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache")
+        with self.connection:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    completion TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )"""
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_used_at ON llm_cache (used_at)"
+            )
+        self._prune()
+
+    def _run(self, function: Callable[..., Any], *args) -> "asyncio.Future[Any]":
+        """Runs a blocking database call on the cache's thread."""
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args)
+        )
+
+    @staticmethod
+    def key(params: dict, prompt: str) -> str:
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+        digest.update(prompt.encode())
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._run(self._get, key)
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT completion FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE llm_cache SET used_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    async def set(self, key: str, completion: str, model: Optional[str] = None):
+        await self._run(self._set, key, completion, model)
+
+    def _set(self, key: str, completion: str, model: Optional[str]):
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, completion, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, completion, now, now),
+            )
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self._prune()
+
+    async def prune(self):
+        """Drops expired entries and the least recently used beyond max_entries."""
+        await self._run(self._prune)
+
+    def _prune(self):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM llm_cache WHERE created_at <= ?", (time.time() - self.ttl,)
+            )
+            self.connection.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def size(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+_cache: Optional[LLMCache] = None
+
+
+def configure_llm_cache(path: Optional[str], ttl: float = 7 * 24 * 3600, max_entries: int = 10000):
+    """Caches deterministic calls in `path`; a falsy path turns caching off."""
+    global _cache
+    _cache = LLMCache(path, ttl=ttl, max_entries=max_entries) if path else None
+    metrics.gauge("llm_cache_entries", "Completions in the LLM cache.").set_function(
+        lambda: _cache.size() if _cache is not None else 0
+    )
+
+
+@contextmanager
+def bypass_llm_cache(bypass: bool = True):
+    """Skips cache reads for the LLM calls in the block."""
+    token = bypass_var.set(bypass)
+    try:
+        yield
+    finally:
+        bypass_var.reset(token)
+
+
+async def cached_arun(
+    chain, inputs: dict, priority: int = AGENT, callbacks: Optional[list] = None
+) -> str:
+    """`chain.arun(inputs)` through the LLM dispatcher, answered from the
+    cache when the chain's LLM is deterministic and the same prompt was
+    seen before."""
+    params = chain.llm.dict()
+    if _cache is None or params.get("temperature") != 0:
+        return await dispatch_arun(chain, inputs, priority, callbacks=callbacks)
+    prompt = chain.prompt.format_prompt(**inputs).to_string()
+    key = _cache.key(params, prompt)
+    if bypass_var.get():
+        LLM_CACHE_LOOKUPS.inc(result="bypass")
+    else:
+        completion = await _cache.get(key)
+        if completion is not None:
+            LLM_CACHE_LOOKUPS.inc(result="hit")
+            return completion
+        LLM_CACHE_LOOKUPS.inc(result="miss")
+    completion = await dispatch_arun(chain, inputs, priority, prompt=prompt, callbacks=callbacks)
+    await _cache.set(key, completion, model=params.get("model_name"))
+    return completion
@@ -0,0 +1,183 @@
+"""Central admission control for LLM calls.
+
+Every chain call of the router and the agents goes through one dispatcher,
+which queues it per model until two budgets allow it:
+
+- a concurrency limit: at most `max_concurrency` calls in flight;
+- a tokens-per-minute budget: a token bucket charged with an estimate of
+  the call's prompt and completion tokens, corrected with the actual usage
+  when the call runs inside `track_llm`.
+
+Waiting calls are admitted by priority class, then in arrival order, so a
+reply to a comment overtakes a backlog of issue evaluations. Calls queue
+rather than fail when a budget is exhausted.
+
+Example usage:
+
+    configure_llm_dispatcher({"gpt-4": 4}, {"gpt-4": 40000})
+    output = await dispatch_arun(chain, {"issue": issue.dict()}, priority=INTERACTIVE)
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from langchain.callbacks.manager import openai_callback_var
+
+from linear_scheduler import TokenBucket
+import metrics
+
+T = TypeVar("T")
+
+# Priority classes, most urgent first.
+INTERACTIVE = 0  # replies to comments
+ROUTING = 1  # choosing an agent
+AGENT = 2  # agents working on an issue
+BULK = 3  # evaluations and other background work
+PRIORITY_NAMES = {INTERACTIVE: "interactive", ROUTING: "routing", AGENT: "agent", BULK: "bulk"}
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TOKENS_PER_MINUTE = 40000
+# Completion tokens assumed for calls that do not set max_tokens.
+DEFAULT_COMPLETION_TOKENS = 500
+
+LLM_DISPATCH_WAIT_SECONDS = metrics.histogram(
+    "llm_dispatch_wait_seconds", "Time LLM calls wait for admission.", ["model", "priority"]
+)
+
+
+def estimate_tokens(prompt: str, params: dict) -> int:
+    """Roughly four characters per token, plus the completion allowance."""
+    return len(prompt) // 4 + (params.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+class _ModelQueue:
+    def __init__(self, max_concurrency: int, tokens_per_minute: float):
+        self.max_concurrency = max_concurrency
+        self.budget = TokenBucket(capacity=tokens_per_minute, refill_per_second=tokens_per_minute / 60)
+        self.in_flight = 0
+        # (priority, arrival, estimated tokens, future)
+        self.waiting: List[Tuple[int, int, int, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class LLMDispatcher:
+    def __init__(
+        self,
+        concurrency: Optional[Dict[str, int]] = None,
+        tokens_per_minute: Optional[Dict[str, float]] = None,
+    ):
+        self.concurrency = concurrency or {}
+        self.tokens_per_minute = tokens_per_minute or {}
+        self.queues: Dict[str, _ModelQueue] = {}
+        self._arrivals = itertools.count()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self.queues.get(model)
+        if queue is None:
+            queue = self.queues[model] = _ModelQueue(
+                self.concurrency.get(model, DEFAULT_CONCURRENCY),
+                self.tokens_per_minute.get(model, DEFAULT_TOKENS_PER_MINUTE),
+            )
+        return queue
+
+    def depth(self) -> Dict[Tuple[str, ...], float]:
+        """Calls waiting for admission, by model."""
+        return {(model,): len(queue.waiting) for model, queue in self.queues.items()}
+
+    def _admit(self, model: str):
+        queue = self.queues[model]
+        queue.timer = None
+        while queue.waiting and queue.in_flight < queue.max_concurrency:
+            _, _, tokens, future = queue.waiting[0]
+            if future.done():  # cancelled while waiting
+                heapq.heappop(queue.waiting)
+                continue
+            delay = queue.budget.delay(tokens)
+            if delay > 0:
+                # The head waits for the budget and everything else behind it,
+                # so a big urgent call is not starved by small bulk ones.
+                queue.timer = asyncio.get_running_loop().call_later(delay, self._admit, model)
+                return
+            heapq.heappop(queue.waiting)
+            queue.budget.take(tokens)
+            queue.in_flight += 1
+            future.set_result(None)
+
+    async def run(
+        self,
+        model: str,
+        call: Callable[[], Awaitable[T]],
+        priority: int = AGENT,
+        estimated_tokens: int = DEFAULT_COMPLETION_TOKENS,
+    ) -> T:
+        """Waits for admission, then awaits `call()`."""
+        queue = self._queue(model)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiting, (priority, next(self._arrivals), estimated_tokens, future))
+        started_at = time.perf_counter()
+        if queue.timer is None:
+            self._admit(model)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled: free the slot.
+                queue.in_flight -= 1
+                self._admit(model)
+            raise
+        LLM_DISPATCH_WAIT_SECONDS.observe(
+            time.perf_counter() - started_at,
+            model=model,
+            priority=PRIORITY_NAMES.get(priority, str(priority)),
+        )
+
+        usage = openai_callback_var.get()
+        tokens_before = usage.total_tokens if usage is not None else None
+        try:
+            return await call()
+        finally:
+            queue.in_flight -= 1
+            used = usage.total_tokens - tokens_before if usage is not None else 0
+            if used:
+                # Charge what the call actually used instead of the estimate.
+                # Streaming calls report no usage and keep the estimate.
+                queue.budget.take(used - estimated_tokens)
+            if queue.timer is None:
+                self._admit(model)
+
+
+_dispatcher = LLMDispatcher()
+metrics.gauge(
+    "llm_dispatch_queue_depth", "LLM calls waiting for admission.", ["model"]
+).set_function(lambda: _dispatcher.depth())
+
+
+def configure_llm_dispatcher(
+    concurrency: Optional[Dict[str, int]] = None,
+    tokens_per_minute: Optional[Dict[str, float]] = None,
+):
+    """Sets the per-model limits; models not listed get the defaults."""
+    global _dispatcher
+    _dispatcher = LLMDispatcher(concurrency, tokens_per_minute)
+
+
+async def dispatch_arun(
+    chain,
+    inputs: dict,
+    priority: int = AGENT,
+    prompt: Optional[str] = None,
+    callbacks: Optional[list] = None,
+) -> str:
+    """`chain.arun(inputs, callbacks=callbacks)` through the dispatcher.
+    Pass the rendered `prompt` if it is at hand already."""
+    params = chain.llm.dict()
+    if prompt is None:
+        prompt = chain.prompt.format_prompt(**inputs).to_string()
+    return await _dispatcher.run(
+        params.get("model_name", params.get("_type", "unknown")),
+        lambda: chain.arun(inputs, callbacks=callbacks),
+        priority=priority,
+        estimated_tokens=estimate_tokens(prompt, params),
+    )
@@ -0,0 +1,41 @@
+"""Latency and token metrics for LLM chain calls, labelled by agent."""
+import time
+from contextlib import contextmanager
+
+from langchain.callbacks import get_openai_callback
+
+import metrics
+
+LLM_SECONDS = metrics.histogram(
+    "llm_duration_seconds", "LLM chain call latency.", ["agent"]
+)
+LLM_TOKENS = metrics.counter(
+    "llm_tokens_total", "Tokens used by LLM chain calls.", ["agent", "kind"]
+)
+LLM_ERRORS = metrics.counter(
+    "llm_errors_total", "LLM chain calls that raised.", ["agent", "type"]
+)
+
+
+@contextmanager
+def track_llm(agent: str):
+    """Records the latency and token usage of the LLM calls in the block.
+
+    Example usage:
+
+        with track_llm("GPT4"):
+            result = await chain.arun(...)
+    """
+    started_at = time.perf_counter()
+    # The callback lives in a context variable, so concurrent tasks each
+    # count their own tokens.
+    with get_openai_callback() as usage:
+        try:
+            yield usage
+        except Exception as e:
+            LLM_ERRORS.inc(agent=agent, type=type(e).__name__)
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started_at, agent=agent)
+            LLM_TOKENS.inc(usage.prompt_tokens, agent=agent, kind="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens, agent=agent, kind="completion")
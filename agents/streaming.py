@@ -0,0 +1,87 @@
+"""Progressive writes of streamed LLM output.
+
+A ThrottledWriter is a langchain callback handler: pass it to a chain
+whose LLM has `streaming=True` and it collects the tokens and hands the
+text so far to `write` in the background, at most once per `interval`
+seconds unless `min_chars` new characters have piled up, and never with
+two writes in flight. Token handling never waits on the write, so a slow
+Linear API does not slow the completion down. `finish` then writes the
+final text exactly once, or `discard` removes the partial output.
+
+Example usage:
+
+    stream = ThrottledWriter(update_comment, interval=2.0, min_chars=500)
+    result = await cached_arun(chain, inputs, callbacks=[stream])
+    await stream.finish(result)
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from langchain.callbacks.base import AsyncCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# Appended to partial output so readers can tell it is still being written.
+IN_PROGRESS_MARKER = " …"
+
+
+class ThrottledWriter(AsyncCallbackHandler):
+    def __init__(
+        self,
+        write: Callable[[str], Awaitable[Any]],
+        interval: float = 2.0,
+        min_chars: int = 500,
+        discard: Optional[Callable[[], Awaitable[Any]]] = None,
+    ):
+        self.write = write
+        self._discard = discard
+        self.interval = interval
+        self.min_chars = min_chars
+        self.text = ""
+        self.writes = 0
+        self._written_chars = 0
+        # Set by the first token, so the first write waits a full interval.
+        self._written_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.text += token
+        if self._written_at is None:
+            self._written_at = time.monotonic()
+        if self._task is not None:
+            return
+        pending = len(self.text) - self._written_chars
+        elapsed = time.monotonic() - self._written_at
+        if pending >= self.min_chars or (pending and elapsed >= self.interval):
+            self._task = asyncio.get_running_loop().create_task(self._write_partial())
+
+    async def _write_partial(self):
+        text = self.text
+        try:
+            await self.write(text + IN_PROGRESS_MARKER)
+            self.writes += 1
+        except Exception:
+            # Partial output is best effort; finish() still writes the result.
+            logger.warning("could not write partial output", exc_info=True)
+        finally:
+            self._written_chars = len(text)
+            self._written_at = time.monotonic()
+            self._task = None
+
+    async def finish(self, final: Optional[str] = None):
+        """Waits for a write in flight, then writes `final`, if given, once."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        if final is not None:
+            await self.write(final)
+            self.writes += 1
+
+    async def discard(self):
+        """Waits for a write in flight, then removes what was written, if
+        the writer was given a way to."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        if self.writes and self._discard is not None:
+            await self._discard()
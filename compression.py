@@ -0,0 +1,172 @@
+"""Response compression with Accept-Encoding negotiation.
+
+Like starlette's GZipMiddleware, but also speaks brotli when the optional
+`brotli` package is installed and the client prefers it, and flushes the
+compressor after every chunk of a streaming response, so NDJSON lines
+reach the client as they are produced rather than when a buffer fills up.
+
+Example usage:
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+"""
+import zlib
+from typing import Dict, Optional, Union
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional
+    brotli = None
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        # wbits=31 writes a gzip header and trailer.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parses an Accept-Encoding header into {coding: q}."""
+    encodings = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[coding.strip().lower()] = q
+    return encodings
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        encodings = accepted_encodings(accept_encoding)
+        wildcard = encodings.get("*", 0.0)
+        candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+        best, best_q = None, 0.0
+        for coding in candidates:
+            q = encodings.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def encoder(self, encoding: str) -> "Encoder":
+        if encoding == "br":
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await CompressionResponder(self, encoding, send).run(self.app, scope, receive)
+
+
+Encoder = Union[GzipEncoder, BrotliEncoder]
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message: Optional[Message] = None
+        # None until the first body message decides whether to compress.
+        self.encoder: Optional[Encoder] = None
+        self.passthrough = False
+
+    async def run(self, app: ASGIApp, scope: Scope, receive: Receive):
+        await app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Held back until we know whether the body gets compressed.
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or message["status"] in (204, 304)
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if self.passthrough or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            encoder = self.encoder = self.middleware.encoder(self.encoding)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            # The compressed bytes differ per encoding, so a strong ETag of
+            # the uncompressed body only holds weakly for them.
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = encoder.compress(body) + encoder.finish()
+                headers["Content-Length"] = str(len(body))
+                await self.send(start)
+                await self.send({**message, "body": body})
+                return
+            await self.send(start)
+        elif self.passthrough:
+            await self.send(message)
+            return
+
+        assert self.encoder is not None, "body message before the response start"
+        body = self.encoder.compress(body)
+        body += self.encoder.flush() if more_body else self.encoder.finish()
+        await self.send({**message, "body": body})
@@ -0,0 +1,402 @@
+"""A small durable job queue backed by SQLite.
+
+Jobs survive restarts, are deduplicated by an optional key (e.g. a webhook
+delivery id), retried with exponential backoff, and jobs sharing a
+`serial_key` (e.g. an issue id) run one at a time, in the order they were
+enqueued. A job enqueued
+with the `coalesce_key` of a job that is still waiting replaces that job's
+payload instead of adding another job. Context variables registered with
+`propagate` are saved with each job and set again while it runs, like the
+tracing context. Finished jobs are deleted `retention` seconds after
+they finished.
+
+SQLite calls block, so they run on the queue's own thread, one at a time.
+
+Example usage:
+
+    queue = JobQueue("jobs.sqlite3")
+    queue.register("linear_webhook", process_linear_webhook)
+    queue.start()
+    job_id, created = await queue.enqueue("linear_webhook", payload, dedup_key=delivery_id)
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import metrics
+import tracing
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+JOB_SECONDS = metrics.histogram(
+    "job_duration_seconds", "Time spent running a job attempt.", ["kind"]
+)
+JOB_LATENCY_SECONDS = metrics.histogram(
+    "job_latency_seconds",
+    "Time from enqueueing a job to its successful completion, e.g. webhook end-to-end latency.",
+    ["kind"],
+)
+JOB_FAILURES = metrics.counter(
+    "job_failures_total", "Failed job attempts.", ["kind", "final"]
+)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str = "jobs.sqlite3",
+        workers: int = 4,
+        max_attempts: int = 3,
+        retry_backoff: float = 5.0,
+        poll_interval: float = 1.0,
+        retention: float = 7 * 24 * 3600,
+        sweep_interval: float = 3600.0,
+    ):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.sweep_interval = sweep_interval
+        self.handlers: Dict[str, Tuple[Callable[[Any], Awaitable[Any]], int]] = {}
+        self.context_vars: Dict[str, contextvars.ContextVar] = {}
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-queue")
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.connection:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    dedup_key TEXT UNIQUE,
+                    serial_key TEXT,
+                    coalesce_key TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    run_after REAL NOT NULL,
+                    error TEXT,
+                    result TEXT,
+                    traceparent TEXT,
+                    context TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(jobs)")}
+            for column in ("traceparent", "context"):
+                if column not in columns:
+                    self.connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_coalesce_key ON jobs (coalesce_key, status)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_serial_key ON jobs (serial_key, status)"
+            )
+            # Dedup keys of the jobs a coalesced job replaced, so their
+            # redeliveries are still recognized.
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS job_dedup_keys (
+                    dedup_key TEXT PRIMARY KEY,
+                    job_id INTEGER NOT NULL
+                )"""
+            )
+
+    def _run(self, function: Callable[..., T], *args, **kwargs) -> "asyncio.Future[T]":
+        """Runs a blocking database call on the queue's thread."""
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args, **kwargs)
+        )
+
+    def register(
+        self,
+        kind: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        max_attempts: Optional[int] = None,
+    ):
+        """Registers the coroutine function that runs jobs of `kind`."""
+        self.handlers[kind] = (handler, max_attempts or self.max_attempts)
+
+    def propagate(self, var: contextvars.ContextVar):
+        """Runs jobs with the value `var` had when they were enqueued. The
+        value must be JSON serializable."""
+        self.context_vars[var.name] = var
+
+    def _capture_context(self) -> Optional[str]:
+        context = {}
+        for name, var in self.context_vars.items():
+            value = var.get(None)
+            if value is not None:
+                context[name] = value
+        return json.dumps(context) if context else None
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: Any,
+        dedup_key: Optional[str] = None,
+        serial_key: Optional[str] = None,
+        coalesce_key: Optional[str] = None,
+    ) -> Tuple[int, bool]:
+        """Adds a job. Returns its id and whether it was newly created; an
+        existing job with the same dedup_key, or a waiting job with the same
+        coalesce_key, is returned instead of a new one.
+
+        The job runs as a child of the span that enqueued it, if any, and
+        with the propagated context variables it was enqueued with."""
+        job_id, created = await self._run(
+            self._enqueue,
+            kind,
+            json.dumps(payload),
+            dedup_key,
+            serial_key,
+            coalesce_key,
+            tracing.current_traceparent(),
+            self._capture_context(),
+        )
+        if created and self._wake is not None:
+            self._wake.set()
+        return job_id, created
+
+    def _enqueue(
+        self,
+        kind: str,
+        payload: str,
+        dedup_key: Optional[str],
+        serial_key: Optional[str],
+        coalesce_key: Optional[str],
+        traceparent: Optional[str],
+        context: Optional[str],
+    ) -> Tuple[int, bool]:
+        now = time.time()
+        with self.connection:
+            if dedup_key is not None:
+                row = self.connection.execute(
+                    "SELECT id FROM jobs WHERE dedup_key = ? "
+                    "UNION ALL SELECT job_id FROM job_dedup_keys WHERE dedup_key = ?",
+                    (dedup_key, dedup_key),
+                ).fetchone()
+                if row is not None:
+                    return row[0], False
+            if coalesce_key is not None:
+                row = self.connection.execute(
+                    "SELECT id, dedup_key FROM jobs "
+                    "WHERE coalesce_key = ? AND status = ? AND attempts = 0",
+                    (coalesce_key, QUEUED),
+                ).fetchone()
+                if row is not None:
+                    if dedup_key is not None:
+                        # The job now carries this delivery; the one it
+                        # replaced stays known as a duplicate.
+                        if row["dedup_key"] is not None:
+                            self.connection.execute(
+                                "INSERT OR IGNORE INTO job_dedup_keys (dedup_key, job_id) "
+                                "VALUES (?, ?)",
+                                (row["dedup_key"], row["id"]),
+                            )
+                        self.connection.execute(
+                            "UPDATE jobs SET dedup_key = ? WHERE id = ?", (dedup_key, row["id"])
+                        )
+                    self.connection.execute(
+                        "UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                        (payload, now, row["id"]),
+                    )
+                    return row["id"], False
+            cursor = self.connection.execute(
+                "INSERT INTO jobs "
+                "(kind, payload, dedup_key, serial_key, coalesce_key, status, run_after, "
+                "traceparent, context, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    kind,
+                    payload,
+                    dedup_key,
+                    serial_key,
+                    coalesce_key,
+                    QUEUED,
+                    now,
+                    traceparent,
+                    context,
+                    now,
+                    now,
+                ),
+            )
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid, True
+
+    async def get(self, job_id: int) -> Optional[dict]:
+        return await self._run(self._get, job_id)
+
+    def _get(self, job_id: int) -> Optional[dict]:
+        row = self.connection.execute(
+            "SELECT id, kind, status, attempts, error, result, created_at, updated_at "
+            "FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def depth(self) -> int:
+        """Number of jobs waiting to run. A single indexed count, read
+        directly so metrics gauges can call it."""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+        ).fetchone()[0]
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        with self.connection:
+            # A job waits for running jobs with its serial_key, and for older
+            # queued ones, e.g. a job backing off before a retry.
+            row = self.connection.execute(
+                "SELECT * FROM jobs WHERE status = ? AND run_after <= ? "
+                "AND (serial_key IS NULL OR NOT EXISTS "
+                "(SELECT 1 FROM jobs AS other WHERE other.serial_key = jobs.serial_key "
+                "AND (other.status = ? OR (other.status = ? AND other.id < jobs.id)))) "
+                "ORDER BY id LIMIT 1",
+                (QUEUED, now, RUNNING, QUEUED),
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, now, row["id"]),
+            )
+        return row
+
+    def _finish(self, job_id: int, status: str, run_after: float = 0.0, error=None, result=None):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, run_after = ?, error = ?, result = ?, updated_at = ? "
+                "WHERE id = ?",
+                (status, run_after, error, result, time.time(), job_id),
+            )
+
+    async def _run_job(self, row: sqlite3.Row):
+        attempts = row["attempts"] + 1
+        if row["kind"] not in self.handlers:
+            # E.g. a job left by an older deploy: retrying will not help.
+            logger.error("no handler for job", extra={"job_id": row["id"], "kind": row["kind"]})
+            JOB_FAILURES.inc(kind=row["kind"], final="true")
+            await self._run(
+                self._finish, row["id"], FAILED, error=f"no handler for {row['kind']!r} jobs"
+            )
+            return
+        handler, max_attempts = self.handlers[row["kind"]]
+        tokens = [
+            (self.context_vars[name], self.context_vars[name].set(value))
+            for name, value in json.loads(row["context"] or "{}").items()
+            if name in self.context_vars
+        ]
+        try:
+            with tracing.span(
+                f"job {row['kind']}",
+                kind=tracing.CONSUMER,
+                traceparent=row["traceparent"],
+                **{"job.id": row["id"], "job.attempt": attempts},
+            ), JOB_SECONDS.time(kind=row["kind"]):
+                result = await handler(json.loads(row["payload"]))
+        except Exception as e:
+            logger.warning(
+                "job failed",
+                exc_info=True,
+                extra={"job_id": row["id"], "kind": row["kind"], "attempt": attempts},
+            )
+            JOB_FAILURES.inc(kind=row["kind"], final=str(attempts >= max_attempts).lower())
+            if attempts < max_attempts:
+                delay = self.retry_backoff * 2 ** (attempts - 1)
+                await self._run(self._finish, row["id"], QUEUED, time.time() + delay, error=repr(e))
+            else:
+                await self._run(self._finish, row["id"], FAILED, error=repr(e))
+        else:
+            await self._run(self._finish, row["id"], DONE, result=json.dumps(result, default=str))
+            JOB_LATENCY_SECONDS.observe(time.time() - row["created_at"], kind=row["kind"])
+        finally:
+            for var, token in reversed(tokens):
+                var.reset(token)
+
+    def sweep(self) -> int:
+        """Deletes jobs that finished more than `retention` seconds ago.
+        Returns how many were deleted."""
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - self.retention),
+            )
+            self.connection.execute(
+                "DELETE FROM job_dedup_keys WHERE job_id NOT IN (SELECT id FROM jobs)"
+            )
+        return cursor.rowcount
+
+    async def _sweeper(self):
+        while True:
+            try:
+                deleted = await self._run(self.sweep)
+                if deleted:
+                    logger.info("deleted finished jobs", extra={"count": deleted})
+            except sqlite3.Error:
+                logger.warning("could not delete finished jobs", exc_info=True)
+            await asyncio.sleep(self.sweep_interval)
+
+    async def _worker(self):
+        # wait_for can swallow a cancellation that races the wakeup, so the
+        # workers also check a flag.
+        while not self._stopping:
+            try:
+                row = await self._run(self._claim)
+                if row is not None:
+                    await self._run_job(row)
+                    # Jobs serialized behind this one may be runnable now.
+                    self._wake.set()
+                    continue
+            except sqlite3.Error:
+                logger.exception("job queue database error")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Starts the workers. Jobs left running by a previous process are
+        requeued, so a single process should own the database."""
+        if self._tasks:
+            return
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING)
+            )
+        self._stopping = False
+        self._wake = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(loop.create_task(self._sweeper()))
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,41 @@
+"""Per-key asyncio locks, e.g. one per Linear issue id."""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+
+
+class KeyedLock:
+    """Serializes work per key while different keys proceed in parallel.
+
+    Locks are created on first use and dropped once nobody holds or waits for
+    them, so the number of live locks stays bounded by the work in flight.
+
+    Example usage:
+
+        issue_locks = KeyedLock()
+        async with issue_locks(issue_id):
+            ...
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._users: Dict[Hashable, int] = {}
+
+    def locked(self, key: Hashable) -> bool:
+        return key in self._locks and self._locks[key].locked()
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def __call__(self, key: Hashable):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
@@ -0,0 +1,103 @@
+"""Batching and coalescing of issueUpdate mutations.
+
+Updates issued within a short window are sent to Linear as one aliased
+mutation (see `batch_issue_update`), and successive updates to the same issue
+in that window are merged into a single issueUpdate.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from linear_graphql_queries import batch_issue_update
+
+
+class _PendingUpdate:
+    def __init__(self, issue_id: str, input: dict, future: asyncio.Future):
+        self.issue_id = issue_id
+        self.input = input
+        self.future = future
+
+
+class IssueUpdateBatcher:
+    """Collects issueUpdate inputs and flushes them as one GraphQL document.
+
+    Each caller gets back a result shaped like the single "update_issue"
+    query's, i.e. either {"data": {"issueUpdate": {...}}} or
+    {"errors": [...]}, so callers handle both paths the same way.
+
+    Example usage:
+
+        batcher = IssueUpdateBatcher(client._arun_graphql_query)
+        result = await batcher.update_issue(issue_id, {"stateId": state_id})
+    """
+
+    def __init__(
+        self,
+        run_query: Callable[..., Awaitable[dict]],
+        window: float = 0.01,
+        max_batch_size: int = 25,
+    ):
+        self.run_query = run_query
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, _PendingUpdate] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def update_issue(self, issue_id: str, input: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(issue_id)
+        if pending is not None:
+            # Later fields win, as they would have with sequential updates.
+            pending.input.update(input)
+        else:
+            pending = _PendingUpdate(issue_id, dict(input), loop.create_future())
+            self._pending[issue_id] = pending
+
+        if len(self._pending) >= self.max_batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._start_flush)
+
+        # Coalesced callers share the future; one being cancelled must not
+        # cancel the others.
+        return await asyncio.shield(pending.future)
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = list(self._pending.values())
+        self._pending = {}
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[_PendingUpdate]):
+        variables: Dict[str, Any] = {}
+        for i, pending in enumerate(batch):
+            variables[f"id{i}"] = pending.issue_id
+            variables[f"input{i}"] = pending.input
+        try:
+            result = await self.run_query(batch_issue_update(len(batch)), variables)
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        data = result.get("data") or {}
+        errors = result.get("errors") or []
+        for i, pending in enumerate(batch):
+            alias = f"u{i}"
+            # Errors without a path apply to the whole document.
+            own_errors = [
+                e for e in errors if not e.get("path") or e["path"][0] == alias
+            ]
+            if own_errors or not data.get(alias):
+                pending_result = {"errors": own_errors or [f"{alias}: no data returned"]}
+            else:
+                pending_result = {"data": {"issueUpdate": data[alias]}}
+            if not pending.future.done():
+                pending.future.set_result(pending_result)
@@ -0,0 +1,156 @@
+"""In-memory cache of Linear reference data: workflow states, issue labels,
+users and teams.
+
+Values are refreshed after a TTL (serving the stale value while a single
+refresh runs in the background) and dropped when a Linear webhook reports
+that the underlying objects changed.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300.0
+
+
+class CachedValue(Generic[T]):
+    """A single lazily loaded value with a TTL and single-flight refresh.
+
+    Concurrent readers of a missing value share one load. Once loaded, reads
+    never wait: an expired value is returned as-is while a refresh runs in
+    the background.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[T]], ttl: float = DEFAULT_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self._value: Optional[T] = None
+        self._loaded = False
+        self._expires_at = 0.0
+        self._generation = 0
+        self._refresh: Optional[asyncio.Task] = None
+        self._refresh_generation = 0
+
+    async def get(self) -> T:
+        if self._loaded:
+            if time.monotonic() >= self._expires_at:
+                self._start_refresh()
+            return self._value  # type: ignore[return-value]
+        return await asyncio.shield(self._start_refresh())
+
+    async def refresh(self) -> T:
+        """Loads the value now and waits for it, even if it has not expired."""
+        return await asyncio.shield(self._start_refresh())
+
+    @property
+    def expired(self) -> bool:
+        """Whether the value is missing or past its TTL."""
+        return not self._loaded or time.monotonic() >= self._expires_at
+
+    def peek(self) -> Optional[T]:
+        """Returns the cached value, if any, without loading it."""
+        return self._value
+
+    def invalidate(self):
+        self._value = None
+        self._loaded = False
+        self._generation += 1
+
+    def _start_refresh(self) -> asyncio.Task:
+        # A load started before an invalidation would return stale data.
+        if (
+            self._refresh is None
+            or self._refresh.done()
+            or self._refresh_generation != self._generation
+        ):
+            self._refresh_generation = self._generation
+            self._refresh = asyncio.get_running_loop().create_task(self._load())
+            self._refresh.add_done_callback(self._log_failure)
+        return self._refresh
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        # Background refreshes have no one awaiting them to see the error.
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("could not refresh a cached value", exc_info=task.exception())
+
+    async def _load(self) -> T:
+        generation = self._generation
+        value = await self.loader()
+        # Don't store a value fetched before an invalidation arrived; the
+        # next read will load a fresh one.
+        if generation == self._generation:
+            self._value = value
+            self._loaded = True
+            self._expires_at = time.monotonic() + self.ttl
+        return value
+
+
+class ReferenceDataCache:
+    """Reference data used on the webhook and API hot paths.
+
+    Example usage:
+
+        cache = ReferenceDataCache(linear_client)
+        labels = await cache.issue_labels.get()
+        cache.handle_webhook(payload)  # from /webhooks/linear
+    """
+
+    # Linear webhook `type` -> the cached values it affects.
+    WEBHOOK_INVALIDATIONS = {
+        "IssueLabel": ("issue_labels",),
+        "WorkflowState": ("workflow_states",),
+        "User": ("users",),
+        "Team": ("teams", "workflow_states"),
+    }
+
+    def __init__(self, linear_client, ttl: float = DEFAULT_TTL):
+        self.linear_client = linear_client
+        self.workflow_states: CachedValue[Dict[str, str]] = CachedValue(
+            self._load_workflow_states, ttl
+        )
+        self.issue_labels = CachedValue(linear_client.list_issue_labels, ttl)
+        self.users = CachedValue(linear_client.list_users, ttl)
+        self.teams = CachedValue(linear_client.list_teams, ttl)
+
+    async def _load_workflow_states(self) -> Dict[str, str]:
+        _, team_id = self.linear_client._get_api_key_and_team_id()
+        return await self.linear_client.get_linear_workflow_states(team_id)
+
+    async def warm(self):
+        """Loads every cached value, e.g. at startup."""
+        await asyncio.gather(
+            self.workflow_states.get(),
+            self.issue_labels.get(),
+            self.users.get(),
+            self.teams.get(),
+        )
+
+    def invalidate(self):
+        for value in (self.workflow_states, self.issue_labels, self.users, self.teams):
+            value.invalidate()
+
+    def handle_webhook(self, payload: Dict[str, Any]) -> bool:
+        """Invalidates whatever a Linear webhook payload changed.
+
+        Returns True if anything was invalidated.
+        """
+        names = self.WEBHOOK_INVALIDATIONS.get(payload.get("type", ""), ())
+        for name in names:
+            getattr(self, name).invalidate()
+        return bool(names)
+
+    async def state_id(self, state_name: str) -> str:
+        """Returns the workflow state id for a state name like "In Review"."""
+        return (await self.workflow_states.get())[state_name]
+
+    async def state_name(self, state_id: str) -> Optional[str]:
+        """Returns the workflow state name for a workflow state id."""
+        for name, id in (await self.workflow_states.get()).items():
+            if id == state_id:
+                return name
+        return None
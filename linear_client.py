@@ -1,9 +1,13 @@
-import os
-from typing import List, Optional
-import requests
+import asyncio
+import functools
+import inspect
+import logging
+import re
+import time
+import uuid
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Sequence, Type
 import json
 from enum import Enum
-from typing import Any
 
 import httpx
 from pydantic import BaseModel, Field, Json
@@ -23,9 +27,19 @@ from linear_types import (
     AttachmentCreateInput,
 )
 from linear_graphql_queries import QUERIES
+from linear_query_builder import compile_query
+from linear_scheduler import RateLimitScheduler
+from linear_batching import IssueUpdateBatcher
+from linear_cache import ReferenceDataCache
+from linear_construct import M, construct_model
+from settings import Settings
+import metrics
+import tracing
 
-status = {}
-status_reversed = {}
+if TYPE_CHECKING:
+    from linear_sync import LinearMirror
+
+logger = logging.getLogger(__name__)
 
 
 class LinearError(Exception):
@@ -41,8 +55,17 @@ class IssueState(Enum):
     BACKLOG = "backlog"
     TODO = "todo"
 
-    def state_id(self) -> Any:
-        return status[self.name.lower().replace("_", " ").title()]
+    def state_name(self) -> str:
+        """Returns the name of the matching Linear workflow state, e.g. "In Review"."""
+        return self.name.lower().replace("_", " ").title()
+
+    @classmethod
+    def from_state_name(cls, name: Optional[str]) -> Optional["IssueState"]:
+        """Returns the IssueState for a Linear workflow state name, if any."""
+        try:
+            return cls((name or "").lower().replace(" ", "_"))
+        except ValueError:
+            return None
 
 
 class ListIssuesInput(BaseModel):
@@ -66,6 +89,12 @@ class IssueInput(BaseModel):
     label_ids: Optional[List[str]] = None
 
 
+class BulkIssueResult(BaseModel):
+    index: int
+    issue: Optional[Issue] = None
+    error: Optional[str] = None
+
+
 class AssignIssueInput(BaseModel):
     issue_id: str
     assignee_id: str
@@ -102,64 +131,223 @@ class DocumentInput(BaseModel):
     content_data: Optional[Json] = None
 
 
+_OPERATION = re.compile(r"\b(?:query|mutation)\s+(\w+)")
+
+
+@functools.lru_cache(maxsize=256)
+def _operation_name(query: str) -> str:
+    match = _OPERATION.search(query)
+    return match.group(1) if match else "anonymous"
+
+
+# Mutations that leave the same state however often they are applied.
+IDEMPOTENT_MUTATIONS = {
+    "issueUpdate",
+    "projectUpdate",
+    "documentUpdate",
+    "projectMilestoneUpdate",
+    "commentUpdate",
+}
+_MUTATION_FIELD = re.compile(r"\b([a-z]\w*(?:Create|Update|Delete|Archive))\s*\(")
+
+
+@functools.lru_cache(maxsize=256)
+def _is_idempotent(query: str) -> bool:
+    """Queries are safe to repeat; mutations only if all their fields are."""
+    if not re.match(r"\s*mutation\b", query):
+        return True
+    return set(_MUTATION_FIELD.findall(query)) <= IDEMPOTENT_MUTATIONS
+
+
+def _error_type(error) -> str:
+    """Linear's error code, e.g. RATELIMITED or INPUT_ERROR."""
+    if not isinstance(error, dict):
+        return "unknown"
+    extensions = error.get("extensions") or {}
+    return str(extensions.get("code") or extensions.get("type") or "unknown")
+
+
+GRAPHQL_SECONDS = metrics.histogram(
+    "linear_graphql_duration_seconds",
+    "Linear GraphQL round trip time, including rate limit waits and retries.",
+    ["operation"],
+)
+LINEAR_ERRORS = metrics.counter(
+    "linear_errors_total",
+    "Failed Linear calls by GraphQL error code or exception type.",
+    ["operation", "type"],
+)
+
+
+# Defaults for the shared async transport. Linear multiplexes requests over
+# HTTP/2, so a handful of connections is plenty even under webhook bursts.
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=20,
+    max_keepalive_connections=10,
+    keepalive_expiry=60.0,
+)
+
+
 class LinearClient:
-    def __init__(self, endpoint):
+    def __init__(
+        self,
+        endpoint,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        http2: bool = True,
+        scheduler: Optional[RateLimitScheduler] = None,
+        batch_window: float = 0.01,
+        cache_ttl: float = 300.0,
+        trusted: bool = False,
+        settings: Optional[Settings] = None,
+    ):
         self.endpoint = endpoint
-        self.session = requests.Session()
-        if os.environ.get("LINEAR_TEAM_ID"):
-            global status
-            global status_reversed
-            status = self.get_linear_workflow_states(os.environ.get("LINEAR_TEAM_ID"))
-            status_reversed = {v: k for k, v in status.items()}
+        # The API key and team id are read from here; the team id may be
+        # resolved after startup, see Settings.resolve_team_id.
+        self.settings = settings or Settings()
+        self.timeout = timeout
+        self.limits = limits
+        self.http2 = http2
+        self.scheduler = scheduler or RateLimitScheduler()
+        # issueUpdate mutations issued within batch_window seconds of each
+        # other are sent as one request.
+        self.batcher = IssueUpdateBatcher(self._arun_graphql_query, window=batch_window)
+        # Workflow states, labels, users and teams, kept fresh by TTL and by
+        # the Linear webhooks.
+        self.cache = ReferenceDataCache(self, ttl=cache_ttl)
+        # Optional linear_sync.LinearMirror, see use_mirror().
+        self.mirror: Optional["LinearMirror"] = None
+        self.mirror_max_staleness: Optional[float] = None
+        # Build response models without validating them, see linear_construct.
+        self.trusted = trusted
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def use_mirror(self, mirror: "LinearMirror", max_staleness: Optional[float] = 60.0):
+        """Serves list_issues/get_issue from a local mirror (see linear_sync)
+        when it was synced less than `max_staleness` seconds ago."""
+        self.mirror = mirror
+        self.mirror_max_staleness = max_staleness
+
+    def _fresh_mirror(self, table: str, max_staleness: Optional[float]) -> Optional["LinearMirror"]:
+        """The mirror, if `table` in it was synced recently enough."""
+        if max_staleness is None:
+            max_staleness = self.mirror_max_staleness
+        if self.mirror is None or max_staleness is None:
+            return None
+        return self.mirror if self.mirror.age(table) <= max_staleness else None
+
+    def _parse(self, model: Type[M], data: dict) -> M:
+        if self.trusted:
+            return construct_model(model, data)
+        return model(**data)
 
     def _get_api_key_and_team_id(self):
-        LINEAR_API_KEY = os.environ.get("LINEAR_API_KEY", "")
-        LINEAR_TEAM_ID = os.environ.get("LINEAR_TEAM_ID", "")
-        return LINEAR_API_KEY, LINEAR_TEAM_ID
-
-    def _run_graphql_query(self, query, variables=None):
-        LINEAR_API_KEY, LINEAR_TEAM_ID = self._get_api_key_and_team_id()
-        print("variables:", json.dumps(variables))
-        return self.session.post(
-            self.endpoint,
-            json={
-                "query": query,
-                "variables": variables or {},
-            },
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {LINEAR_API_KEY}",
-            },
-        ).json()
-
-    async def _arun_graphql_query(self, query, variables=None):
+        return self.settings.linear_api_key or "", self.settings.linear_team_id or ""
+
+    async def startup(self):
+        """Opens the shared async transport and warms the reference data cache.
+
+        Safe to call more than once.
+        """
+        await self._get_async_client()
+        if self.settings.linear_team_id:
+            await self.cache.warm()
+
+    async def aclose(self):
+        """Closes the shared async transport and its pooled connections."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    async def _get_async_client(self) -> httpx.AsyncClient:
+        # Fall back to opening the transport lazily so scripts that never
+        # call startup() keep working.
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return self._async_client
+
+    async def _arun_graphql_query(self, query, variables=None, idempotent: Optional[bool] = None):
+        """Sends a GraphQL document. Failed requests are retried only if
+        `idempotent`, which is inferred from the document unless given."""
+        operation = _operation_name(query)
+        if idempotent is None:
+            idempotent = _is_idempotent(query)
+        with tracing.span(
+            f"graphql {operation}",
+            kind=tracing.CLIENT,
+            **{"graphql.operation.name": operation, "server.address": self.endpoint},
+        ) as span:
+            result, status = await self._post_graphql(query, variables, operation, idempotent)
+            span.set_attribute("http.response.status_code", status)
+            if result.get("errors"):
+                span.set_attribute("graphql.errors", len(result["errors"]))
+            return result
+
+    async def _post_graphql(self, query, variables, operation, idempotent):
         LINEAR_API_KEY, LINEAR_TEAM_ID = self._get_api_key_and_team_id()
-        async with httpx.AsyncClient() as client:
-            r = await client.post(
-                self.endpoint,
-                json={
-                    "query": query,
-                    "variables": variables or {},
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {LINEAR_API_KEY}",
-                },
+        client = await self._get_async_client()
+        started_at = time.perf_counter()
+        try:
+            r = await self.scheduler.run(
+                LINEAR_API_KEY,
+                lambda: client.post(
+                    self.endpoint,
+                    json={
+                        "query": query,
+                        "variables": variables or {},
+                    },
+                    headers={
+                        "Content-Type": "application/json",
+                        "Authorization": f"Bearer {LINEAR_API_KEY}",
+                    },
+                ),
+                idempotent=idempotent,
             )
-        return r.json()
+        except Exception as e:
+            LINEAR_ERRORS.inc(operation=operation, type=type(e).__name__)
+            raise
+        finally:
+            duration = time.perf_counter() - started_at
+            GRAPHQL_SECONDS.observe(duration, operation=operation)
+        try:
+            result = r.json()
+        except ValueError:
+            LINEAR_ERRORS.inc(operation=operation, type="invalid_response")
+            raise LinearError(f"Linear returned HTTP {r.status_code}: {r.text[:200]}")
+        for error in result.get("errors") or ():
+            LINEAR_ERRORS.inc(operation=operation, type=_error_type(error))
+        logger.debug(
+            "graphql %s",
+            operation,
+            extra={
+                "status": r.status_code,
+                "duration_ms": round(duration * 1000, 1),
+                "variables": variables,
+                "result": result,
+            },
+        )
+        return result, r.status_code
 
-    async def get_linear_team_id(self, team_name):
+    async def list_teams(self) -> List[dict]:
         result = await self._arun_graphql_query(
             QUERIES["get_teams"],
         )
         if "errors" in result:
             raise LinearError(result["errors"])
-        for team in result["data"]["teams"]["nodes"]:
+        return result["data"]["teams"]["nodes"]
+
+    async def get_linear_team_id(self, team_name):
+        for team in await self.cache.teams.get():
             if team["name"] == team_name:
                 return team["id"]
         raise LinearError(f"Team {team_name} not found")
 
-    def get_linear_workflow_states(self, team_id):
+    async def get_linear_workflow_states(self, team_id):
         variables = {
             "filter": {
                 "id": {
@@ -167,7 +355,7 @@ class LinearClient:
                 }
             }
         }
-        result = self._run_graphql_query(
+        result = await self._arun_graphql_query(
             QUERIES["get_workflow_states"],
             variables=variables,
         )
@@ -182,38 +370,65 @@ class LinearClient:
 
         return workflow_states
 
-    async def list_issues(self, **kwargs):
+    async def list_issues(
+        self,
+        max_staleness: Optional[float] = None,
+        fields: Optional[Sequence[str]] = None,
+        **kwargs,
+    ):
+        mirror = self._fresh_mirror("issues", max_staleness)
+        if mirror is not None and not any(key.startswith("issues:") for key in mirror.dirty):
+            nodes = await mirror.list_issues(**kwargs)
+            if nodes is not None:
+                return [self._parse(Issue, issue) for issue in nodes]
+
+        return [issue async for issue in self.iter_issues(fields=fields, **kwargs)]
+
+    async def iter_issues(
+        self, page_size: int = 50, fields: Optional[Sequence[str]] = None, **kwargs
+    ) -> AsyncIterator[Issue]:
+        """Yields every issue matching the filters, one page at a time.
+
+        Only the current page is held in memory. Keyword arguments are
+        IssueFilter fields, as for list_issues. `fields` is an optional field
+        mask (see linear_query_builder) limiting what is fetched per issue.
+        """
+        query = QUERIES["list_issues"]
+        if fields is not None:
+            query = compile_query("list_issues", Issue, tuple(fields))
         LINEAR_API_KEY, LINEAR_TEAM_ID = self._get_api_key_and_team_id()
-        variables = {
-            "filter": {
-                "team": {
-                    "id": {
-                        "eq": LINEAR_TEAM_ID,
-                    }
-                },
-            }
+        filter = {
+            "team": {
+                "id": {
+                    "eq": LINEAR_TEAM_ID,
+                }
+            },
         }
         for k, v in kwargs.items():
-            variables["filter"][k] = v
-        print("variables:", json.dumps(variables))
-        result = await self._arun_graphql_query(
-            QUERIES["list_issues"],
-            variables=variables,
-        )
-        print(result)
-        if "errors" in result:
-            raise LinearError(result["errors"])
-        return [Issue(**issue) for issue in result["data"]["issues"]["nodes"]]
-
-    async def create_issue(self, input: IssueInput):
+            filter[k] = v
+        variables = {"filter": filter, "first": page_size, "after": None}
+        while True:
+            result = await self._arun_graphql_query(query, variables=variables)
+            if "errors" in result:
+                raise LinearError(result["errors"])
+            issues = result["data"]["issues"]
+            for issue in issues["nodes"]:
+                yield self._parse(Issue, issue)
+            if not issues["pageInfo"]["hasNextPage"]:
+                return
+            variables["after"] = issues["pageInfo"]["endCursor"]
+
+    async def create_issue(self, input: IssueInput, issue_id: Optional[str] = None):
+        """Creates an issue. `issue_id` optionally sets the new issue's UUID."""
         LINEAR_API_KEY, LINEAR_TEAM_ID = self._get_api_key_and_team_id()
         # TODO(Can we just pass the whole input as variables?)
         variables = {
+            "id": issue_id,
             "teamId": LINEAR_TEAM_ID,
             "title": input.title,
             "description": input.description,
             "priority": input.priority,
-            "stateId": input.state.state_id(),
+            "stateId": await self.cache.state_id(input.state.state_name()),
         }
         if input.parent_id:
             variables["parentId"] = input.parent_id
@@ -221,30 +436,63 @@ class LinearClient:
             variables["projectId"] = input.project_id
         if input.milestone_id:
             variables["projectMilestoneId"] = input.milestone_id
-        result = await self._arun_graphql_query(QUERIES["create_issue"], variables)
-        print("variables:", json.dumps(variables))
-        print(result)
+        # With a client-chosen id a repeated issueCreate cannot duplicate the issue.
+        result = await self._arun_graphql_query(
+            QUERIES["create_issue"], variables, idempotent=issue_id is not None
+        )
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Issue(**result["data"]["issueCreate"]["issue"])
+        return self._parse(Issue, result["data"]["issueCreate"]["issue"])
+
+    async def create_issues(
+        self,
+        inputs: List[IssueInput],
+        idempotency_key: Optional[str] = None,
+        concurrency: int = 8,
+    ) -> List[BulkIssueResult]:
+        """Creates issues concurrently and reports success or failure per item.
+
+        With an idempotency key, each issue gets a UUID derived from the key
+        and its index, so retrying the same request finds the issues created
+        by an earlier attempt instead of creating duplicates.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create(index: int, input: IssueInput) -> BulkIssueResult:
+            issue_id = None
+            if idempotency_key is not None:
+                issue_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{idempotency_key}/{index}"))
+            async with semaphore:
+                try:
+                    issue = await self.create_issue(input, issue_id=issue_id)
+                except Exception as e:
+                    if issue_id is None:
+                        return BulkIssueResult(index=index, error=str(e))
+                    # Most likely created by an earlier attempt.
+                    try:
+                        issue = await self.get_issue(issue_id)
+                    except Exception:
+                        return BulkIssueResult(index=index, error=str(e))
+            return BulkIssueResult(index=index, issue=issue)
+
+        return await asyncio.gather(
+            *[create(index, input) for index, input in enumerate(inputs)]
+        )
 
-    def delete_issue(self, issue_id):
-        result = self._run_graphql_query(
+    async def delete_issue(self, issue_id):
+        result = await self._arun_graphql_query(
             QUERIES["delete_issue"],
             variables={
                 "issueDeleteId": issue_id,
             },
         )
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
         return result["data"]["issueDelete"]["success"]
 
     async def update_issue(self, issue_id, issue: IssueInput):
-        print("in update issue")
         LINEAR_API_KEY, LINEAR_TEAM_ID = self._get_api_key_and_team_id()
         variables = {
-            "id": issue_id,
             "teamId": LINEAR_TEAM_ID,
         }
         if issue.title is not None:
@@ -254,7 +502,7 @@ class LinearClient:
         if issue.priority is not None:
             variables["priority"] = issue.priority
         if issue.state is not None:
-            variables["stateId"] = issue.state.state_id()
+            variables["stateId"] = await self.cache.state_id(issue.state.state_name())
         if issue.label_ids is not None:
             variables["labelIds"] = issue.label_ids
         if issue.parent_id is not None:
@@ -264,64 +512,72 @@ class LinearClient:
         if issue.milestone_id is not None:
             variables["projectMilestoneId"] = issue.milestone_id
 
-        result = await self._arun_graphql_query(QUERIES["update_issue"], variables)
-        print("variables:", json.dumps(variables))
-        print(result)
+        result = await self.batcher.update_issue(issue_id, variables)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Issue(**result["data"]["issueUpdate"]["issue"])
-
-    async def get_issue(self, issue_id):
+        return self._parse(Issue, result["data"]["issueUpdate"]["issue"])
+
+    async def get_issue(
+        self,
+        issue_id,
+        max_staleness: Optional[float] = None,
+        fields: Optional[Sequence[str]] = None,
+    ):
+        """Gets an issue. `fields` is an optional field mask (see
+        linear_query_builder); by default comments and children are included."""
+        mirror = self._fresh_mirror("issues", max_staleness)
+        if mirror is not None and not mirror.is_dirty("issues", issue_id):
+            node = await mirror.get_issue(issue_id)
+            if node is not None:
+                return self._parse(Issue, node)
+
+        query = QUERIES["get_issue"]
+        if fields is not None:
+            query = compile_query("get_issue", Issue, tuple(fields))
         result = await self._arun_graphql_query(
-            QUERIES["get_issue"],
+            query,
             variables={
                 "id": issue_id,
             },
         )
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Issue(**result["data"]["issue"])
+        return self._parse(Issue, result["data"]["issue"])
 
     async def assign_issue(self, issue_id: str, assignee_id: Optional[str]) -> Issue:
         variables = {
-            "id": issue_id,
             "assigneeId": assignee_id,
         }
-        result = await self._arun_graphql_query(QUERIES["assign_issue"], variables)
-        print(f"Assign issue result: {result}")
+        result = await self.batcher.update_issue(issue_id, variables)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Issue(**result["data"]["issueUpdate"]["issue"])
+        return self._parse(Issue, result["data"]["issueUpdate"]["issue"])
 
     async def list_users(self) -> List[User]:
         result = await self._arun_graphql_query(QUERIES["list_users"])
-        print(f"List users result: {result}")
         if "errors" in result:
             raise LinearError(result["errors"])
-        return [User(**user) for user in result["data"]["users"]["nodes"]]
+        return [self._parse(User, user) for user in result["data"]["users"]["nodes"]]
 
-    def list_issue_labels(self) -> List[IssueLabel]:
-        result = self._run_graphql_query(QUERIES["list_issue_labels"])
+    async def list_issue_labels(self) -> List[IssueLabel]:
+        result = await self._arun_graphql_query(QUERIES["list_issue_labels"])
         if "errors" in result:
             raise LinearError(result["errors"])
-        return [IssueLabel(**user) for user in result["data"]["issueLabels"]["nodes"]]
+        return [self._parse(IssueLabel, user) for user in result["data"]["issueLabels"]["nodes"]]
 
     async def list_projects(self) -> List[Project]:
         LINEAR_API_KEY, LINEAR_TEAM_ID = self._get_api_key_and_team_id()
         variables = {
             "teamId": LINEAR_TEAM_ID,
         }
-        print("variables:", json.dumps(variables))
         # TODO: if/when we refactor to support multiple teams, we'll need to change this
         result = await self._arun_graphql_query(
             QUERIES["list_projects_for_team"], variables
         )
-        print(f"List projects result: {result}")
         if "errors" in result:
             raise LinearError(result["errors"])
         return [
-            Project(**project)
+            self._parse(Project, project)
             for project in result["data"]["team"]["projects"]["nodes"]
         ]
 
@@ -333,12 +589,10 @@ class LinearClient:
             "name": input.name,
             "description": input.description,
         }
-        print("variables:", json.dumps(variables))
         result = await self._arun_graphql_query(QUERIES["create_project"], variables)
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Project(**result["data"]["projectCreate"]["project"])
+        return self._parse(Project, result["data"]["projectCreate"]["project"])
 
     async def update_project(self, project_id, project: ProjectInput):
         LINEAR_API_KEY, LINEAR_TEAM_ID = self._get_api_key_and_team_id()
@@ -353,11 +607,9 @@ class LinearClient:
         if project.state is not None:
             variables["state"] = project.state
         result = await self._arun_graphql_query(QUERIES["update_project"], variables)
-        print("variables:", json.dumps(variables))
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Project(**result["data"]["projectUpdate"]["project"])
+        return self._parse(Project, result["data"]["projectUpdate"]["project"])
 
     async def get_project(self, project_id) -> Project:
         result = await self._arun_graphql_query(
@@ -366,10 +618,9 @@ class LinearClient:
                 "id": project_id,
             },
         )
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Project(**result["data"]["project"])
+        return self._parse(Project, result["data"]["project"])
 
     async def delete_project(self, project_id) -> bool:
         result = await self._arun_graphql_query(
@@ -378,7 +629,6 @@ class LinearClient:
                 "id": project_id,
             },
         )
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
         return result["data"]["projectDelete"]["success"]
@@ -391,11 +641,10 @@ class LinearClient:
                 "projectId": project_id,
             },
         )
-        print(f"List documents result: {result}")
         if "errors" in result:
             raise LinearError(result["errors"])
         return [
-            Document(**doc) for doc in result["data"]["project"]["documents"]["nodes"]
+            self._parse(Document, doc) for doc in result["data"]["project"]["documents"]["nodes"]
         ]
 
     async def create_document(self, project_id: str, input: DocumentInput):
@@ -404,12 +653,10 @@ class LinearClient:
             "title": input.title,
             "content": input.content,
         }
-        print("variables:", json.dumps(variables))
         result = await self._arun_graphql_query(QUERIES["create_document"], variables)
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Document(**result["data"]["documentCreate"]["document"])
+        return self._parse(Document, result["data"]["documentCreate"]["document"])
 
     async def update_document(self, document_id: str, input: DocumentInput):
         variables = {
@@ -420,11 +667,9 @@ class LinearClient:
         if input.content is not None:
             variables["content"] = input.content
         result = await self._arun_graphql_query(QUERIES["update_document"], variables)
-        print("variables:", json.dumps(variables))
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Document(**result["data"]["documentUpdate"]["document"])
+        return self._parse(Document, result["data"]["documentUpdate"]["document"])
 
     async def delete_document(self, document_id: str) -> bool:
         result = await self._arun_graphql_query(
@@ -433,7 +678,6 @@ class LinearClient:
                 "id": document_id,
             },
         )
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
         return result["data"]["documentDelete"]["success"]
@@ -445,10 +689,9 @@ class LinearClient:
                 "id": document_id,
             },
         )
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Document(**result["data"]["document"])
+        return self._parse(Document, result["data"]["document"])
 
     # project milestone endpoints
     async def list_milestones(self, project_id: str) -> List[ProjectMilestone]:
@@ -458,11 +701,10 @@ class LinearClient:
                 "projectId": project_id,
             },
         )
-        print(f"List milestones result: {result}")
         if "errors" in result:
             raise LinearError(result["errors"])
         return [
-            ProjectMilestone(**ms)
+            self._parse(ProjectMilestone, ms)
             for ms in result["data"]["project"]["projectMilestones"]["nodes"]
         ]
 
@@ -474,13 +716,11 @@ class LinearClient:
             "targetDate": input.target_date,
             "sortOrder": input.sort_order,
         }
-        print("variables:", json.dumps(variables))
         result = await self._arun_graphql_query(QUERIES["create_milestone"], variables)
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return ProjectMilestone(
-            **result["data"]["projectMilestoneCreate"]["projectMilestone"]
+        return self._parse(
+            ProjectMilestone, result["data"]["projectMilestoneCreate"]["projectMilestone"]
         )
 
     async def update_milestone(self, milestone_id: str, input: ProjectMilestoneInput):
@@ -497,12 +737,10 @@ class LinearClient:
             variables["sortOrder"] = input.sort_order
 
         result = await self._arun_graphql_query(QUERIES["update_milestone"], variables)
-        print("variables:", json.dumps(variables))
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return ProjectMilestone(
-            **result["data"]["projectMilestoneUpdate"]["projectMilestone"]
+        return self._parse(
+            ProjectMilestone, result["data"]["projectMilestoneUpdate"]["projectMilestone"]
         )
 
     async def delete_milestone(self, milestone_id: str) -> bool:
@@ -512,7 +750,6 @@ class LinearClient:
                 "id": milestone_id,
             },
         )
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
         return result["data"]["projectMilestoneDelete"]["success"]
@@ -525,12 +762,24 @@ class LinearClient:
         }
         if input.parent_id is not None:
             variables["parentId"] = input.parent_id
-        print("variables:", json.dumps(variables))
         result = await self._arun_graphql_query(QUERIES["create_comment"], variables)
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Comment(**result["data"]["commentCreate"]["comment"])
+        return self._parse(Comment, result["data"]["commentCreate"]["comment"])
+
+    async def update_comment(self, comment_id: str, body: str):
+        result = await self._arun_graphql_query(
+            QUERIES["update_comment"], {"id": comment_id, "body": body}
+        )
+        if "errors" in result:
+            raise LinearError(result["errors"])
+        return self._parse(Comment, result["data"]["commentUpdate"]["comment"])
+
+    async def delete_comment(self, comment_id: str):
+        result = await self._arun_graphql_query(QUERIES["delete_comment"], {"id": comment_id})
+        if "errors" in result:
+            raise LinearError(result["errors"])
+        return result["data"]["commentDelete"]["success"]
 
     # attachment
     async def create_attachment(self, input: AttachmentCreateInput):
@@ -548,9 +797,62 @@ class LinearClient:
         if not input.url:
             variables["url"] = "https://www.google.com/2"
 
-        print("variables:", json.dumps(variables))
         result = await self._arun_graphql_query(QUERIES["create_attachment"], variables)
-        print(result)
         if "errors" in result:
             raise LinearError(result["errors"])
-        return Attachment(**result["data"]["attachmentCreate"]["attachment"])
+        return self._parse(Attachment, result["data"]["attachmentCreate"]["attachment"])
+
+
+class SyncLinearClient:
+    """A blocking facade over LinearClient for scripts and the REPL.
+
+    Every coroutine method of LinearClient is exposed as a regular method that
+    runs to completion on a private event loop, and every async generator
+    method (e.g. iter_issues) as a regular generator. Do not use this from
+    inside a running event loop (e.g. a FastAPI handler); await LinearClient
+    instead.
+
+    Example usage:
+
+        client = SyncLinearClient(endpoint="https://api.linear.app/graphql")
+        print(client.list_issue_labels())
+        for issue in client.iter_issues(page_size=100):
+            print(issue.title)
+        client.close()
+    """
+
+    def __init__(self, endpoint, **kwargs):
+        self._client = LinearClient(endpoint, **kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._client.startup())
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if inspect.isasyncgenfunction(attr):
+
+            @functools.wraps(attr)
+            def iterate_sync(*args, **kwargs):
+                agen = attr(*args, **kwargs)
+                try:
+                    while True:
+                        try:
+                            yield self._loop.run_until_complete(agen.__anext__())
+                        except StopAsyncIteration:
+                            return
+                finally:
+                    # Also runs when the caller stops iterating early.
+                    self._loop.run_until_complete(agen.aclose())
+
+            return iterate_sync
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def run_sync(*args, **kwargs):
+            return self._loop.run_until_complete(attr(*args, **kwargs))
+
+        return run_sync
+
+    def close(self):
+        self._loop.run_until_complete(self._client.aclose())
+        self._loop.close()
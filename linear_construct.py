@@ -0,0 +1,92 @@
+"""Builds pydantic models from trusted Linear payloads without validating them.
+
+`Issue(**node)` validates and coerces every field of every nested object.
+Linear's responses already have the right types, so in trusted mode
+LinearClient builds models with `construct_model` instead. It assigns each
+field directly, recursing into nested models and lists of models, and
+ignores keys the model doesn't declare, just like validation does.
+
+A per-model plan of which fields need recursion is computed once and cached.
+Immutable defaults are cached with it; mutable ones, and default factories,
+are produced afresh for every model built, as pydantic does.
+
+Example usage:
+
+    issue = construct_model(Issue, result["data"]["issue"])
+"""
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+
+M = TypeVar("M", bound=BaseModel)
+
+# (field name, key in the payload, default, a function producing the default
+# when it must not be shared between models, converter for the field's value,
+# None when the value is used as is)
+Plan = List[
+    Tuple[str, str, Any, Optional[Callable[[], Any]], Optional[Callable[[Any], Any]]]
+]
+
+_IMMUTABLE = (type(None), bool, int, float, complex, str, bytes, frozenset, Enum)
+
+
+def _list_of(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def convert_list(values):
+        if values is None:
+            return None
+        return [convert(value) for value in values]
+
+    return convert_list
+
+
+def _converter(field) -> Optional[Callable[[Any], Any]]:
+    type_ = field.type_
+    while get_origin(type_) is Union:
+        type_ = next(arg for arg in get_args(type_) if arg is not type(None))
+    if not (isinstance(type_, type) and issubclass(type_, BaseModel)):
+        return None
+
+    def convert(value):
+        if value is None or isinstance(value, BaseModel):
+            return value
+        return construct_model(type_, value)
+
+    if field.shape == SHAPE_SINGLETON:
+        return convert
+    if field.shape == SHAPE_LIST:
+        return _list_of(convert)
+    return None
+
+
+def _default_factory(field) -> Optional[Callable[[], Any]]:
+    if field.default_factory is None and isinstance(field.default, _IMMUTABLE):
+        return None
+    return field.get_default
+
+
+@lru_cache(maxsize=None)
+def _plan(model: Type[BaseModel]) -> Plan:
+    return [
+        (field.name, field.alias, field.default, _default_factory(field), _converter(field))
+        for field in model.__fields__.values()
+    ]
+
+
+def construct_model(model: Type[M], data: Dict[str, Any]) -> M:
+    """Builds `model` from `data` without validation."""
+    values = {}
+    fields_set = set()
+    for name, key, default, make_default, convert in _plan(model):
+        if key in data:
+            value = data[key]
+            values[name] = value if convert is None else convert(value)
+            fields_set.add(name)
+        else:
+            values[name] = default if make_default is None else make_default()
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__fields_set__", fields_set)
+    return instance
@@ -1,4 +1,5 @@
 """This file contains all the queries used in the linear_client.py file"""
+from functools import lru_cache
 
 QUERIES = {
     "get_teams": """
@@ -78,8 +79,12 @@ query Issue($id: String!) {
         }
         }}""",
     "list_issues": """
-query Issues($filter: IssueFilter) {
-  issues(filter: $filter) {
+query Issues($filter: IssueFilter, $first: Int, $after: String) {
+  issues(filter: $filter, first: $first, after: $after) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
     nodes {
         id
         title
@@ -109,6 +114,7 @@ query Issues($filter: IssueFilter) {
   }
 }""",
     "create_issue": """mutation IssueCreate(
+      $id: String
       $title: String!
       $description: String!
       $priority: Int
@@ -120,6 +126,7 @@ query Issues($filter: IssueFilter) {
     ) {
       issueCreate(
         input: {
+          id: $id
           title: $title
           description: $description
           priority: $priority
@@ -489,6 +496,22 @@ query IssueLabels {
       }
     }
 """,
+    # update comment
+    "update_comment": """
+    mutation UpdateComment($id: String!, $body: String!) {
+      commentUpdate(id: $id, input: { body: $body }) {
+        comment {
+          id
+          body
+        }
+      }
+    }
+""",
+    "delete_comment": """mutation CommentDelete($id: String!) {
+  commentDelete(id: $id) {
+    success
+  }
+}""",
                         
 "create_attachment": """mutation CreateAttachment(
         $issueId: String!
@@ -519,3 +542,194 @@ query IssueLabels {
 
 }
 
+# Templates compiled by linear_query_builder with a per-call field mask. The
+# `{selection}` line is replaced with the generated selection set.
+QUERY_TEMPLATES = {
+    "get_issue": """
+query Issue($id: String!) {
+  issue(id: $id) {
+    {selection}
+  }
+}""",
+    "list_issues": """
+query Issues($filter: IssueFilter, $first: Int, $after: String) {
+  issues(filter: $filter, first: $first, after: $after) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      {selection}
+    }
+  }
+}""",
+}
+
+# Paginated queries used by linear_sync to mirror the workspace. They include
+# archived objects so the mirror learns about archivals, and updatedAt so
+# later polls only fetch what changed.
+SYNC_QUERIES = {
+    "issues": """
+query SyncIssues($filter: IssueFilter, $first: Int, $after: String) {
+  issues(filter: $filter, first: $first, after: $after, includeArchived: true) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      id
+      title
+      identifier
+      description
+      priority
+      updatedAt
+      archivedAt
+      parent {
+        id
+        identifier
+      }
+      project {
+        id
+      }
+      assignee {
+        id
+        name
+      }
+      state {
+        id
+        name
+      }
+      labels {
+        nodes {
+          id
+          name
+        }
+      }
+      projectMilestone {
+        id
+        name
+      }
+    }
+  }
+}""",
+    "projects": """
+query SyncProjects($filter: ProjectFilter, $first: Int, $after: String) {
+  projects(filter: $filter, first: $first, after: $after, includeArchived: true) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      id
+      name
+      state
+      description
+      updatedAt
+      archivedAt
+      projectMilestones {
+        nodes {
+          id
+          name
+          description
+          targetDate
+          sortOrder
+          updatedAt
+        }
+      }
+    }
+  }
+}""",
+    "documents": """
+query SyncDocuments($first: Int, $after: String) {
+  documents(first: $first, after: $after, orderBy: updatedAt, includeArchived: true) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      id
+      title
+      content
+      contentData
+      updatedAt
+      archivedAt
+      project {
+        id
+      }
+    }
+  }
+}""",
+    "comments": """
+query SyncComments($filter: CommentFilter, $first: Int, $after: String) {
+  comments(filter: $filter, first: $first, after: $after, includeArchived: true) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      id
+      body
+      updatedAt
+      archivedAt
+      issue {
+        id
+      }
+      user {
+        name
+        email
+        isMe
+      }
+    }
+  }
+}""",
+}
+
+# Selection returned for every issue of a batched issueUpdate. It covers what
+# both "update_issue" and "assign_issue" return.
+BATCH_ISSUE_UPDATE_SELECTION = """
+        issue {
+          id
+          title
+          identifier
+          priority
+          state {
+            id
+            name
+          }
+          assignee {
+            id
+            name
+          }
+          labels {
+            nodes {
+              id
+              name
+            }
+          }
+          projectMilestone {
+            id
+            name
+          }
+        }"""
+
+
+@lru_cache(maxsize=None)
+def batch_issue_update(count: int) -> str:
+    """Builds one mutation running `count` aliased issueUpdate operations.
+
+    The i-th operation is aliased u<i> and takes the variables $id<i> and
+    $input<i>, e.g. for two updates:
+
+        mutation BatchIssueUpdate($id0: String!, $input0: IssueUpdateInput!, ...) {
+          u0: issueUpdate(id: $id0, input: $input0) { ... }
+          u1: issueUpdate(id: $id1, input: $input1) { ... }
+        }
+    """
+    definitions = ", ".join(
+        f"$id{i}: String!, $input{i}: IssueUpdateInput!" for i in range(count)
+    )
+    operations = "\n".join(
+        f"  u{i}: issueUpdate(id: $id{i}, input: $input{i}) {{{BATCH_ISSUE_UPDATE_SELECTION}\n  }}"
+        for i in range(count)
+    )
+    return f"mutation BatchIssueUpdate({definitions}) {{\n{operations}\n}}"
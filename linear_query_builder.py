@@ -0,0 +1,92 @@
+"""Builds GraphQL selections from the pydantic models in linear_types.py.
+
+Callers pass a field mask of dotted paths, e.g.
+
+    ["id", "title", "state.name", "labels.nodes.name"]
+
+A path that stops at an object field selects that object's scalar fields,
+and a connection (a model with `nodes`) selects the scalar fields of its
+nodes. Fields whose GraphQL name differs from the model's are aliased to the
+model's snake_case name, so responses validate straight into the model.
+Compiled documents are cached per (template, model, mask).
+"""
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from linear_graphql_queries import QUERY_TEMPLATES
+
+FieldTree = Dict[str, "FieldTree"]
+
+
+def _camel(name: str) -> str:
+    head, *rest = name.split("_")
+    return head + "".join(part.title() for part in rest)
+
+
+def _model_type(model: Type[BaseModel], name: str) -> Optional[Type[BaseModel]]:
+    if name not in model.__fields__:
+        raise ValueError(f"{model.__name__} has no field {name!r}")
+    type_ = model.__fields__[name].type_
+    while get_origin(type_) is Union:
+        type_ = next(arg for arg in get_args(type_) if arg is not type(None))
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        return type_
+    return None
+
+
+def _default_tree(model: Type[BaseModel]) -> FieldTree:
+    tree: FieldTree = {
+        name: {} for name in model.__fields__ if _model_type(model, name) is None
+    }
+    if not tree and "nodes" in model.__fields__:
+        tree = {"nodes": {}}
+    return tree
+
+
+def _mask_tree(fields: Sequence[str]) -> FieldTree:
+    tree: FieldTree = {}
+    for path in fields:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _render(model: Type[BaseModel], tree: FieldTree, indent: int) -> str:
+    lines = []
+    pad = " " * indent
+    for name, subtree in tree.items():
+        sub_model = _model_type(model, name)
+        graphql_name = _camel(name)
+        head = graphql_name if graphql_name == name else f"{name}: {graphql_name}"
+        if sub_model is None:
+            if subtree:
+                raise ValueError(f"{model.__name__}.{name} is not an object")
+            lines.append(pad + head)
+            continue
+        inner = _render(sub_model, subtree or _default_tree(sub_model), indent + 2)
+        lines.append(f"{pad}{head} {{\n{inner}\n{pad}}}")
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=256)
+def build_selection(model: Type[BaseModel], fields: Tuple[str, ...], indent: int = 0) -> str:
+    """Returns the selection set (without braces) for `model` and `fields`."""
+    return _render(model, _mask_tree(fields), indent)
+
+
+@lru_cache(maxsize=256)
+def compile_query(name: str, model: Type[BaseModel], fields: Tuple[str, ...]) -> str:
+    """Fills the `{selection}` placeholder of QUERY_TEMPLATES[name]."""
+    template = QUERY_TEMPLATES[name]
+    indent = _placeholder_indent(template)
+    return template.replace(" " * indent + "{selection}", build_selection(model, fields, indent))
+
+
+def _placeholder_indent(template: str) -> int:
+    for line in template.splitlines():
+        if line.strip() == "{selection}":
+            return len(line) - len(line.lstrip(" "))
+    raise ValueError("template has no {selection} placeholder")
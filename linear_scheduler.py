@@ -0,0 +1,228 @@
+"""Rate limit aware scheduling of outbound Linear GraphQL requests.
+
+Linear limits every API key to a number of requests and a number of
+complexity points per hour, and reports what is left through the
+X-RateLimit-* response headers. The scheduler keeps a token bucket per API
+key, paces queued requests through it and retries rate limited or failed
+requests with jittered exponential backoff.
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# Linear's documented defaults for API key authentication.
+DEFAULT_REQUESTS_PER_HOUR = 1500
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Transport errors raised before the request was sent, so safe to retry
+# even for requests that are not idempotent.
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class TokenBucket:
+    """A token bucket that refills continuously and can be resynced from
+    the rate limit headers Linear returns."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        # Set when Linear reports an exhausted budget; nothing is sent before.
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def delay(self, amount: float = 1) -> float:
+        """Returns how long to wait before `amount` tokens are available."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        amount = min(amount, self.capacity)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.refill_per_second)
+        return wait
+
+    def take(self, amount: float = 1):
+        """Takes `amount` tokens; a negative amount gives tokens back."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def sync(self, remaining: int, reset_in: Optional[float]):
+        """Aligns the bucket with the server's view of the budget."""
+        self._refill(time.monotonic())
+        if remaining <= 0 and reset_in is not None:
+            # The budget is spent until the window resets, and is full after.
+            self.block_for(reset_in)
+            self.tokens = self.capacity
+        else:
+            self.tokens = min(self.tokens, remaining)
+
+
+class RateLimitScheduler:
+    """Queues, paces and retries requests per API key.
+
+    Requests for the same API key are admitted in FIFO order through that
+    key's token bucket, with at most `max_concurrency` in flight at once.
+
+    Example usage:
+
+        scheduler = RateLimitScheduler()
+        response = await scheduler.run(api_key, lambda: client.post(url, json=body))
+    """
+
+    def __init__(
+        self,
+        requests_per_hour: float = DEFAULT_REQUESTS_PER_HOUR,
+        max_concurrency: int = 10,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+    ):
+        self.requests_per_hour = requests_per_hour
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.buckets: Dict[str, TokenBucket] = {}
+        self._admission_locks: Dict[str, asyncio.Lock] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Metrics
+        self.queue_depth = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "wait_count": self.wait_count,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+    def _bucket(self, api_key: str) -> TokenBucket:
+        if api_key not in self.buckets:
+            self.buckets[api_key] = TokenBucket(
+                capacity=self.requests_per_hour,
+                refill_per_second=self.requests_per_hour / 3600,
+            )
+            self._admission_locks[api_key] = asyncio.Lock()
+        return self.buckets[api_key]
+
+    async def _acquire(self, api_key: str):
+        bucket = self._bucket(api_key)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = time.monotonic()
+        self.queue_depth += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, so this is our queue.
+            async with self._admission_locks[api_key]:
+                delay = bucket.delay()
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = bucket.delay()
+                bucket.take()
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+        waited = time.monotonic() - started
+        self.wait_count += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def _update_from_headers(self, api_key: str, headers: httpx.Headers):
+        bucket = self._bucket(api_key)
+        for kind in ("Requests", "Complexity"):
+            remaining = headers.get(f"X-RateLimit-{kind}-Remaining")
+            if remaining is None:
+                continue
+            reset_in = None
+            reset_at = headers.get(f"X-RateLimit-{kind}-Reset")
+            if reset_at is not None:
+                # Linear reports the reset as a UTC epoch in milliseconds.
+                reset_in = max(0.0, int(reset_at) / 1000 - time.time())
+            if kind == "Requests":
+                bucket.sync(int(remaining), reset_in)
+            elif int(remaining) <= 0 and reset_in is not None:
+                bucket.block_for(reset_in)
+
+    def _is_rate_limited(self, response: httpx.Response) -> bool:
+        # Linear signals rate limiting either with a 429 or with a 400 whose
+        # GraphQL error carries the RATELIMITED extension code.
+        if response.status_code == 429:
+            return True
+        return response.status_code == 400 and b"RATELIMITED" in response.content
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        # "Full jitter" exponential backoff.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def run(
+        self,
+        api_key: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        idempotent: bool = True,
+    ) -> httpx.Response:
+        """Sends a request through the scheduler, retrying it when Linear
+        rate limits us or fails transiently.
+
+        Requests that are not `idempotent` may have taken effect when a
+        response is lost or is a 5xx, so they are only retried when they
+        never reached Linear or were rate limited.
+
+        The last response is returned once the retries are exhausted; transport
+        errors are re-raised.
+        """
+        attempt = 0
+        while True:
+            await self._acquire(api_key)
+            try:
+                response = await send()
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                if not idempotent and not isinstance(e, UNSENT_ERRORS):
+                    raise
+                response = None
+            finally:
+                self._semaphore.release()
+
+            if response is not None:
+                self._update_from_headers(api_key, response.headers)
+                rate_limited = self._is_rate_limited(response)
+                if rate_limited:
+                    self.rate_limited += 1
+                retryable = rate_limited or (
+                    idempotent and response.status_code in RETRYABLE_STATUS_CODES
+                )
+                if not retryable or attempt >= self.max_retries:
+                    return response
+
+            delay = self._backoff(attempt, response)
+            if response is not None and self._is_rate_limited(response):
+                self._bucket(api_key).block_for(delay)
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,340 @@
+"""An optional local SQLite mirror of the Linear workspace.
+
+LinearSyncEngine does an initial load of issues, projects (with their
+milestones), documents and comments using cursor pagination, then keeps the
+mirror current with periodic updatedAt delta polls. Linear webhooks delete
+removed objects right away and trigger an early poll for changed ones; until
+that poll lands the changed objects are marked dirty so reads skip them.
+
+LinearClient can serve list_issues/get_issue from the mirror when it is fresh
+enough, see LinearClient.use_mirror.
+
+SQLite calls block, so LinearMirror runs them on its own thread and its
+reads and writes are coroutines. Sync bookkeeping is also kept in memory,
+so freshness checks never touch the database.
+
+Example usage:
+
+    mirror = LinearMirror("linear.sqlite3")
+    engine = LinearSyncEngine(linear_client, mirror)
+    linear_client.use_mirror(mirror, max_staleness=60)
+    engine.start()
+"""
+import asyncio
+import functools
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from linear_client import LinearError
+from linear_graphql_queries import SYNC_QUERIES
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# table -> extra indexed columns, each read from a nested {"id": ...} object
+# of the GraphQL node.
+TABLES = {
+    "issues": {"project_id": "project", "parent_id": "parent"},
+    "projects": {},
+    "documents": {"project_id": "project"},
+    "milestones": {"project_id": "project"},
+    "comments": {"issue_id": "issue"},
+}
+
+# Linear webhook `type` -> mirror table.
+WEBHOOK_TABLES = {
+    "Issue": "issues",
+    "Project": "projects",
+    "Document": "documents",
+    "ProjectMilestone": "milestones",
+    "Comment": "comments",
+}
+
+
+class LinearMirror:
+    """SQLite storage for mirrored Linear objects.
+
+    Every table stores the GraphQL node as JSON next to its id, updatedAt,
+    archivedAt and a few foreign keys used for lookups. All database access
+    after construction happens on a single worker thread, in call order.
+    """
+
+    def __init__(self, path: str = "linear_mirror.sqlite3"):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.dirty: Dict[str, float] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="linear-mirror")
+        self._create_tables()
+        self._state: Dict[str, str] = {
+            row["key"]: row["value"]
+            for row in self.connection.execute("SELECT key, value FROM sync_state")
+        }
+
+    def _create_tables(self):
+        with self.connection:
+            for table, foreign_keys in TABLES.items():
+                extra = "".join(f", {column} TEXT" for column in foreign_keys)
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    f"id TEXT PRIMARY KEY, updated_at TEXT, archived_at TEXT{extra}, data TEXT)"
+                )
+                for column in foreign_keys:
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})"
+                    )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.connection.close()
+
+    def _run(self, function: Callable[..., T], *args, **kwargs) -> "asyncio.Future[T]":
+        """Runs a blocking database call on the mirror's thread."""
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args, **kwargs)
+        )
+
+    # sync bookkeeping
+    def get_state(self, key: str) -> Optional[str]:
+        return self._state.get(key)
+
+    async def set_state(self, key: str, value: str):
+        self._state[key] = value
+        await self._run(self._set_state, key, value)
+
+    def _set_state(self, key: str, value: str):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+
+    def age(self, table: str) -> float:
+        """Seconds since `table` was last synced (infinite if never)."""
+        synced_at = self.get_state(f"{table}.synced_at")
+        if synced_at is None:
+            return float("inf")
+        return time.time() - float(synced_at)
+
+    def is_dirty(self, table: str, id: str) -> bool:
+        return f"{table}:{id}" in self.dirty
+
+    # writes
+    async def upsert(self, table: str, nodes: Iterable[Dict[str, Any]]):
+        await self._run(self._upsert, table, list(nodes))
+
+    def _upsert(self, table: str, nodes: List[Dict[str, Any]]):
+        foreign_keys = TABLES[table]
+        columns = ["id", "updated_at", "archived_at", *foreign_keys, "data"]
+        rows = [
+            (
+                node["id"],
+                node.get("updatedAt"),
+                node.get("archivedAt"),
+                *[(node.get(field) or {}).get("id") for field in foreign_keys.values()],
+                json.dumps(node),
+            )
+            for node in nodes
+        ]
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                rows,
+            )
+
+    def delete(self, table: str, id: str):
+        """Queues the deletion; reads issued afterwards will not see the object."""
+        self._executor.submit(self._delete, table, id)
+
+    def _delete(self, table: str, id: str):
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {table} WHERE id = ?", (id,))
+
+    # reads
+    def _select(self, table: str, where: str = "", params: tuple = ()) -> List[dict]:
+        sql = f"SELECT data FROM {table} WHERE archived_at IS NULL"
+        if where:
+            sql += f" AND {where}"
+        return [json.loads(row["data"]) for row in self.connection.execute(sql, params)]
+
+    async def get_issue(self, issue_id: str) -> Optional[dict]:
+        """Returns the issue shaped like the "get_issue" query's result."""
+        return await self._run(self._get_issue, issue_id)
+
+    def _get_issue(self, issue_id: str) -> Optional[dict]:
+        issues = self._select("issues", "id = ?", (issue_id,))
+        if not issues:
+            return None
+        issue = issues[0]
+        issue["comments"] = {"nodes": self._select("comments", "issue_id = ?", (issue_id,))}
+        issue["children"] = {
+            "nodes": [
+                {"id": child["id"], "title": child["title"], "state": child["state"]}
+                for child in self._select("issues", "parent_id = ?", (issue_id,))
+            ]
+        }
+        return issue
+
+    async def list_issues(self, **filters) -> Optional[List[dict]]:
+        """Lists issues matching LinearClient.list_issues style filters.
+
+        Only `project` and `parent` id equality filters are supported; None is
+        returned for anything else so the caller can ask Linear instead.
+        """
+        where, params = [], []
+        for field, column in (("project", "project_id"), ("parent", "parent_id")):
+            if field not in filters:
+                continue
+            value = filters.pop(field)
+            if set(value) != {"id"} or set(value["id"]) != {"eq"}:
+                return None
+            where.append(f"{column} = ?")
+            params.append(value["id"]["eq"])
+        if filters:
+            return None
+        return await self._run(self._select, "issues", " AND ".join(where), tuple(params))
+
+
+class LinearSyncEngine:
+    """Keeps a LinearMirror in sync with Linear."""
+
+    def __init__(
+        self,
+        linear_client,
+        mirror: LinearMirror,
+        poll_interval: float = 60.0,
+        page_size: int = 100,
+    ):
+        self.linear_client = linear_client
+        self.mirror = mirror
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _pages(self, table: str, filter: Optional[dict] = None):
+        """Yields pages of nodes, following pageInfo.endCursor."""
+        after = None
+        while True:
+            variables: Dict[str, Any] = {"first": self.page_size, "after": after}
+            if filter is not None:
+                variables["filter"] = filter
+            result = await self.linear_client._arun_graphql_query(
+                SYNC_QUERIES[table], variables
+            )
+            if "errors" in result:
+                raise LinearError(result["errors"])
+            connection = next(iter(result["data"].values()))
+            yield connection["nodes"]
+            if not connection["pageInfo"]["hasNextPage"]:
+                return
+            after = connection["pageInfo"]["endCursor"]
+
+    def _filter(self, table: str, since: Optional[str]) -> Optional[dict]:
+        _, team_id = self.linear_client._get_api_key_and_team_id()
+        filter: Dict[str, Any] = {}
+        if table == "issues":
+            filter["team"] = {"id": {"eq": team_id}}
+        elif table == "comments":
+            filter["issue"] = {"team": {"id": {"eq": team_id}}}
+        if since is not None:
+            # gte rather than gt: re-fetching the boundary object is harmless,
+            # missing one updated in the same millisecond is not.
+            filter["updatedAt"] = {"gte": since}
+        return filter
+
+    async def sync_table(self, table: str):
+        """Fetches everything in `table` updated since its last sync."""
+        started_at = time.time()
+        since = self.mirror.get_state(f"{table}.updated_since")
+        newest = since
+        filter = None if table == "documents" else self._filter(table, since)
+        async for nodes in self._pages(table, filter):
+            await self.mirror.upsert(table, nodes)
+            if table == "projects":
+                await self.mirror.upsert(
+                    "milestones",
+                    [
+                        {**milestone, "project": {"id": project["id"]}}
+                        for project in nodes
+                        for milestone in (project.get("projectMilestones") or {}).get("nodes", [])
+                    ],
+                )
+            updated = [node["updatedAt"] for node in nodes if node.get("updatedAt")]
+            if updated:
+                newest = max([newest or "", *updated])
+            # Documents can't be filtered by updatedAt, but they are ordered
+            # by it, newest first: stop once we reach what we already have.
+            if table == "documents" and since is not None and updated and min(updated) < since:
+                break
+        if newest:
+            await self.mirror.set_state(f"{table}.updated_since", newest)
+        await self.mirror.set_state(f"{table}.synced_at", str(started_at))
+        if table == "projects":
+            await self.mirror.set_state("milestones.synced_at", str(started_at))
+
+    async def sync(self):
+        """Runs one sync of every table. The first run is the initial load."""
+        started_at = time.time()
+        for table in ("issues", "projects", "documents", "comments"):
+            await self.sync_table(table)
+        for key, marked_at in list(self.mirror.dirty.items()):
+            if marked_at <= started_at:
+                del self.mirror.dirty[key]
+
+    async def run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Linear sync failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def handle_webhook(self, payload: Dict[str, Any]) -> bool:
+        """Applies a Linear webhook to the mirror.
+
+        Removals are applied immediately. Creates and updates mark the object
+        dirty and wake the poller, since webhook payloads aren't shaped like
+        our GraphQL nodes. Returns True if the payload concerned the mirror.
+        """
+        table = WEBHOOK_TABLES.get(payload.get("type", ""))
+        data = payload.get("data") or {}
+        if table is None or "id" not in data:
+            return False
+        now = time.time()
+        if payload.get("action") == "remove":
+            self.mirror.delete(table, data["id"])
+        else:
+            self.mirror.dirty[f"{table}:{data['id']}"] = now
+            self._wake.set()
+        # An issue read from the mirror embeds its comments and children.
+        for issue_id in (data.get("issueId"), data.get("parentId")):
+            if issue_id:
+                self.mirror.dirty[f"issues:{issue_id}"] = now
+        return True
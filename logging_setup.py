@@ -0,0 +1,152 @@
+"""Structured, leveled logging for the app.
+
+Records are written as one JSON object per line by a background thread:
+the request path only puts records on a queue (QueueHandler), so slow
+stdout never blocks the event loop. Before a record is queued:
+
+- records below WARNING may be sampled: a record's `sample_rate` extra, or
+  the configured default, is the probability it is kept;
+- extras holding request/response bodies (see BODY_FIELDS) are replaced by
+  a placeholder unless debug is on.
+
+API keys and bearer tokens are scrubbed from every line on output.
+Debug mode logs at DEBUG, keeps every record and restores full bodies.
+
+Example usage:
+
+    configure_logging(level="INFO", debug=settings.debug)
+    logger = logging.getLogger(__name__)
+    logger.info("issue created", extra={"issue_id": issue.id})
+    logger.debug("graphql response", extra={"result": result})
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+from typing import Optional, TextIO
+
+# Extras that hold request or response bodies.
+BODY_FIELDS = {"variables", "result", "payload", "body", "prompt", "completion"}
+REDACTED = "[redacted]"
+SECRETS = re.compile(
+    r"\b(?:lin_api|lin_oauth|sk)[-_][A-Za-z0-9_-]{6,}"  # Linear and OpenAI keys
+    r"|(?<=Bearer )[A-Za-z0-9._~+/-]+=*"
+)
+
+# Attributes every LogRecord has; anything else came in through `extra`.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def redact(text: str) -> str:
+    return SECRETS.sub(REDACTED, text)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample_rate", self.sample_rate)
+        return rate >= 1.0 or random.random() < rate
+
+
+class BodyRedactingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field in BODY_FIELDS.intersection(vars(record)):
+            setattr(record, field, REDACTED)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "sample_rate":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return redact(json.dumps(entry, default=str))
+
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep the record's extras and exception for JsonFormatter, unlike
+        # the stock prepare(), but render the message and traceback now,
+        # while their arguments are still alive.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        # Snapshot mutable extras as the JSON they will be written as, so
+        # changes the caller makes after logging don't show up in the line.
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not isinstance(value, _SCALARS):
+                setattr(record, key, json.loads(json.dumps(value, default=str)))
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _stop_listener():
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def configure_logging(
+    level: str = "INFO",
+    debug: bool = False,
+    sample_rate: float = 1.0,
+    stream: TextIO = sys.stdout,
+):
+    """Routes the root logger through a queue to a JSON line writer.
+
+    Safe to call more than once; the last call wins.
+    """
+    global _listener
+    _stop_listener()
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    if not debug:
+        handler.addFilter(SamplingFilter(sample_rate))
+        handler.addFilter(BodyRedactingFilter())
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG if debug else level.upper())
+    # Keep third-party chatter out of debug traces.
+    for noisy in ("httpx", "httpcore", "hpack", "openai", "urllib3"):
+        logging.getLogger(noisy).setLevel(max(root.level, logging.INFO))
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
@@ -1,21 +1,36 @@
 # main.py
-import os
-from typing import List
+import asyncio
+import hashlib
+import json
+import logging
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, Request, Body
+from fastapi import FastAPI, HTTPException, Request, Body, Header
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import modal
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv, set_key
+from dotenv import load_dotenv
 from fastapi.templating import Jinja2Templates
 
+from compression import CompressionMiddleware
+import metrics
+import tracing
+from job_queue import JobQueue
+from logging_setup import configure_logging
+from response_cache import ResponseCache
+from responses import ModelJSONResponse, dumps
+from settings import Settings
+from keyed_lock import KeyedLock
+from webhook_router import WebhookRouter
 from linear_client import LinearClient
 from linear_client import (
     IssueInput,
     AssignIssueInput,
     IssueModificationInput,
-    status_reversed,
+    IssueState,
+    BulkIssueResult,
 )
 
 # Project types:
@@ -25,13 +40,24 @@ from linear_types import ProjectMilestone, ProjectMilestoneInput
 from linear_types import CommentCreateInput
 
 load_dotenv()
+settings = Settings()
+configure_logging(
+    level=settings.log_level, debug=settings.debug, sample_rate=settings.log_sample_rate
+)
+tracing.configure_tracing(settings.traces_path)
+logger = logging.getLogger(__name__)
 
 from agents.agent_router import AgentRouter # noqa
+from agents.agent_classifier import KeywordClassifier, NaiveBayesClassifier, RoutingLog # noqa
+from agents.llm_cache import BYPASS_HEADER, bypass_llm_cache, bypass_var, configure_llm_cache # noqa
+from agents.llm_dispatcher import configure_llm_dispatcher # noqa
+from agents.streaming import ThrottledWriter # noqa
 
 
 app = FastAPI(
     title="AutoPM",
     description="Automate your project management",
+    default_response_class=ModelJSONResponse,
     servers=[
         {
             "url": "http://localhost:8000",
@@ -46,13 +72,108 @@ app = FastAPI(
 templates = Jinja2Templates(directory="templates")
 stub = modal.Stub("form_generator")
 
-linear_client = LinearClient(endpoint="https://api.linear.app/graphql")
+linear_client = LinearClient(
+    endpoint="https://api.linear.app/graphql",
+    trusted=settings.linear_trusted_payloads,
+    settings=settings,
+)
+configure_llm_cache(
+    settings.llm_cache_path, ttl=settings.llm_cache_ttl, max_entries=settings.llm_cache_max_entries
+)
+configure_llm_dispatcher(settings.llm_concurrency, settings.llm_tokens_per_minute)
+routing_log = RoutingLog(settings.routing_log_path)
 agent_router = AgentRouter(
     agent_kwargs={
         "linear_client": linear_client,
-    }
+    },
+    classifiers=(
+        [
+            KeywordClassifier(),
+            NaiveBayesClassifier.from_log(
+                routing_log, min_accuracy=settings.agent_classifier_min_accuracy
+            ),
+        ]
+        if settings.agent_classifier_enabled
+        else []
+    ),
+    classifier_threshold=settings.agent_classifier_threshold,
+    explore_rate=settings.agent_classifier_explore_rate,
+    routing_log=routing_log,
 )
 
+
+# Optional local mirror of the workspace, enabled by setting LINEAR_MIRROR_PATH.
+sync_engine = None
+if settings.linear_mirror_path:
+    from linear_sync import LinearMirror, LinearSyncEngine, WEBHOOK_TABLES
+
+    mirror = LinearMirror(settings.linear_mirror_path)
+    sync_engine = LinearSyncEngine(linear_client, mirror)
+    linear_client.use_mirror(mirror, max_staleness=settings.linear_mirror_max_staleness)
+
+
+# Rendered list responses, served with ETags to polling clients.
+response_cache = ResponseCache(
+    ttl=settings.response_cache_ttl, max_entries=settings.response_cache_max_entries
+)
+
+
+# Webhook processing runs in the background so Linear gets its ACK right away.
+job_queue = JobQueue(
+    settings.job_queue_path,
+    workers=settings.job_queue_workers,
+    retention=settings.job_queue_retention,
+)
+# Webhooks sent with `X-LLM-Cache: bypass` bypass the cache in their jobs too.
+job_queue.propagate(bypass_var)
+
+
+WEBHOOK_ACK_SECONDS = metrics.histogram(
+    "webhook_ack_duration_seconds", "Time to acknowledge a Linear webhook."
+)
+WEBHOOKS = metrics.counter(
+    "webhooks_total", "Linear webhooks received, by what happened to them.", ["outcome"]
+)
+metrics.gauge("job_queue_depth", "Jobs waiting to run.").set_function(job_queue.depth)
+metrics.gauge(
+    "linear_scheduler_queue_depth", "Linear requests waiting for rate limit budget."
+).set_function(lambda: linear_client.scheduler.queue_depth)
+metrics.gauge(
+    "linear_scheduler_wait_seconds_max", "Longest wait for Linear rate limit budget."
+).set_function(lambda: linear_client.scheduler.wait_seconds_max)
+metrics.counter(
+    "linear_scheduler_wait_seconds_total", "Total time spent waiting for Linear rate limit budget."
+).set_function(lambda: linear_client.scheduler.wait_seconds_total)
+metrics.counter(
+    "linear_retries_total", "Linear requests retried after a failure or rate limit."
+).set_function(lambda: linear_client.scheduler.retries)
+metrics.counter(
+    "linear_rate_limited_total", "Linear responses that reported a rate limit."
+).set_function(lambda: linear_client.scheduler.rate_limited)
+
+
+@app.on_event("startup")
+async def startup():
+    await linear_client.startup()
+    if settings.setup_done and not settings.linear_team_id:
+        try:
+            await settings.resolve_team_id(linear_client)
+        except Exception as e:
+            # The first request will try again.
+            logger.warning("could not resolve the Linear team id: %s", e)
+    job_queue.start()
+    if sync_engine is not None:
+        sync_engine.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    if sync_engine is not None:
+        await sync_engine.stop()
+    await linear_client.aclose()
+
+
 app.mount("/.well-known", StaticFiles(directory=".well-known"), name="well-known")
 app.mount("/assets", StaticFiles(directory="assets"), name="assets")
 origins = [
@@ -67,78 +188,100 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
 
 
 @app.middleware("http")
 async def check_setup(request: Request, call_next):
-    setup_done = (
-        os.environ.get("LINEAR_API_KEY")
-        and os.environ.get("OPENAI_API_KEY")
-        and os.environ.get("SERPAPI_API_KEY")
-        and (
-            os.environ.get("LINEAR_TEAM_NAME")
-            or
-            os.environ.get("LINEAR_TEAM_ID")
-        )
-    )
-    if setup_done or request.url.path == "/favicon.ico":
-        if not os.environ.get("LINEAR_TEAM_ID"):
-            print("Setup Middleware: team ID not set, getting it from linear")
-            # Get team ID
-            linear_team_id = await linear_client.get_linear_team_id(
-                os.environ.get("LINEAR_TEAM_NAME")
-            )
-            set_key(".env", "LINEAR_TEAM_ID", linear_team_id)
-            # load dotenv to pick up team ID change
-            load_dotenv()
+    # Settings are read once at startup; restart after changing .env.
+    if settings.setup_done or request.url.path == "/favicon.ico":
+        if not settings.linear_team_id:
+            await settings.resolve_team_id(linear_client)
         response = await call_next(request)
 
     else:
-        print("Setup Middleware: setup not done, returning 403")
+        logger.warning("setup not done, returning 403", extra={"path": request.url.path})
         raise HTTPException(status_code=403, detail="Forbidden")
     return response
 
 
+@app.middleware("http")
+async def llm_cache_bypass(request: Request, call_next):
+    # `X-LLM-Cache: bypass` makes this request's LLM calls skip cached completions.
+    with bypass_llm_cache(request.headers.get(BYPASS_HEADER, "").lower() == "bypass"):
+        return await call_next(request)
+
+
 @app.get("/issues/", response_model=List[Issue], response_model_exclude_none=True)
-async def list_issues(project_id: str):
+async def list_issues(request: Request, project_id: str):
+    """List issues. Send `Accept: application/x-ndjson` to stream them one per line as they are fetched."""
     filters = {}
     if project_id:
         filters["project"] = {"id": {"eq": project_id}}
-    response = await linear_client.list_issues(**filters)
-    return response
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_issues(filters), media_type="application/x-ndjson"
+        )
+    cached = await response_cache.get(
+        "issues", project_id, lambda: linear_client.list_issues(**filters)
+    )
+    return response_cache.respond(request, cached)
+
+
+def list_response(items: List[BaseModel]):
+    """In trusted mode the models LinearClient returns are serialized as is,
+    skipping FastAPI's second validation pass against `response_model`."""
+    if not linear_client.trusted:
+        return items
+    return ModelJSONResponse(items)
+
+
+async def stream_issues(filters):
+    async for issue in linear_client.iter_issues(**filters):
+        yield dumps(issue) + b"\n"
 
 
 @app.post("/issues/", response_model=Issue, response_model_exclude_none=True)
 async def create_issue(issue: IssueInput):
     response = await linear_client.create_issue(issue)
+    response_cache.invalidate("issues")
     return response
 
 
-@app.post("/issues/bulk/", response_model=List[Issue], response_model_exclude_none=True)
-async def create_issue_bulk(issues: List[IssueInput] = Body(..., embed=True)):
-    response = []
-    for issue in issues:
-        print("creating issue:", issue)
-        response += [await linear_client.create_issue(issue)]
-        print("response:", response)
+@app.post(
+    "/issues/bulk/", response_model=List[BulkIssueResult], response_model_exclude_none=True
+)
+async def create_issue_bulk(
+    issues: List[IssueInput] = Body(..., embed=True),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """Create many issues at once. Each result holds either the created issue or the error for that item.
+
+    Retrying with the same Idempotency-Key header does not create duplicates."""
+    logger.info("creating issues", extra={"count": len(issues)})
+    response = await linear_client.create_issues(issues, idempotency_key=idempotency_key)
+    response_cache.invalidate("issues")
     return response
 
 
 @app.post("/issues/{issue_id}/", response_model=Issue, response_model_exclude_none=True)
 async def patch_issue(issue_id: str, issue: IssueModificationInput):
-    response = await linear_client.update_issue(issue_id, issue)
+    async with issue_locks(issue_id):
+        response = await linear_client.update_issue(issue_id, issue)
+    response_cache.invalidate("issues")
     return response
 
 
 @app.get("/issues/{issueId}", response_model=Issue, response_model_exclude_none=True)
 async def get_issue(issueId: str) -> Issue:
-    response = linear_client.get_issue(issueId)
+    response = await linear_client.get_issue(issueId)
     return response
 
 
 @app.delete("/issues/{issueId}", response_model=Issue, response_model_exclude_none=True)
 async def delete_issue(issueId: str) -> Issue:
     response = await linear_client.delete_issue(issueId)
+    response_cache.invalidate("issues")
     return response
 
 
@@ -149,6 +292,11 @@ class SetupModel(BaseModel):
     linear_team_id: str
 
 
+# Field masks for the webhook paths that don't need whole issues.
+EVALUATION_ISSUE_FIELDS = ("id", "title", "description", "parent.id", "labels", "state")
+SIBLING_ISSUE_FIELDS = ("id", "title", "state.name")
+
+
 def append_label_id_by_name(
     all_labels: List[IssueLabel], current_labels: List[IssueLabel], label_name
 ) -> List[str]:
@@ -159,171 +307,334 @@ def append_label_id_by_name(
     return list(set(label_ids))
 
 
-def remove_label_by_name(labels: List[IssueLabel], label_name) -> List[str]:
-    return [i.id for i in labels if i.name != label_name]
+# Serializes writes to the same issue from webhook jobs and API handlers.
+issue_locks = KeyedLock()
+
+
+async def update_issue_labels(
+    issue_id: str,
+    add: Optional[str] = None,
+    remove: Optional[str] = None,
+    unassign: bool = False,
+    **changes,
+) -> Issue:
+    """Adds and/or removes a label by name, along with any other changes.
+
+    The issue's labels are re-read under its lock right before writing, so
+    label changes made meanwhile (by people or other webhooks) are kept
+    rather than overwritten with a stale list. With `unassign`, the issue is
+    unassigned in the same batch window, so both merge into one issueUpdate.
+    """
+    async with issue_locks(issue_id):
+        issue = await linear_client.get_issue(
+            issue_id, max_staleness=0, fields=("id", "labels")
+        )
+        labels = [i for i in (issue.labels.nodes if issue.labels else []) if i.name != remove]
+        label_ids = [i.id for i in labels]
+        if add:
+            all_issue_labels = await linear_client.cache.issue_labels.get()
+            label_ids = append_label_id_by_name(all_issue_labels, labels, add)
+        update = linear_client.update_issue(
+            issue_id, IssueModificationInput(label_ids=label_ids, **changes)
+        )
+        if not unassign:
+            return await update
+        # Enqueued together, after the label read, so the batcher coalesces them.
+        issue, _ = await asyncio.gather(update, linear_client.assign_issue(issue_id, None))
+        return issue
+
+
+class JobStatus(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    error: Optional[str]
+    result: Optional[str]
+    created_at: float
+    updated_at: float
+
 
+def webhook_issue_id(j) -> Optional[str]:
+    """The id of the issue a webhook is about, if any."""
+    if j.get("type") == "Issue":
+        return j.get("data", {}).get("id")
+    return j.get("data", {}).get("issueId")
 
-all_issue_labels = linear_client.list_issue_labels()
+
+def webhook_coalesce_key(j) -> Optional[str]:
+    """Issue updates changing the same fields are redundant while one is still
+    queued: only the latest needs processing."""
+    if j.get("type") != "Issue" or j.get("action") != "update":
+        return None
+    changed = ",".join(sorted(j.get("updatedFrom", {})))
+    return f"{webhook_issue_id(j)}:update:{changed}"
 
 
 @app.post("/webhooks/linear")
 async def webhooks_linear(request: Request):
-    j = await request.json()
+    # The span is the root of the trace the webhook's job continues.
+    with tracing.span("POST /webhooks/linear", kind=tracing.SERVER) as span:
+        with WEBHOOK_ACK_SECONDS.time():
+            return await accept_linear_webhook(request, span)
+
+
+async def accept_linear_webhook(request: Request, span):
+    body = await request.body()
+    # Most webhooks are irrelevant: drop them before parsing the body.
+    if not webhook_router.might_match(body):
+        WEBHOOKS.inc(outcome="filtered")
+        span.set_attribute("webhook.outcome", "filtered")
+        return {"job_id": None}
+    j = json.loads(body)
+    span.set_attribute("webhook.type", j.get("type"))
+    span.set_attribute("webhook.action", j.get("action"))
+    logger.debug(
+        "webhook received",
+        extra={"type": j.get("type"), "action": j.get("action"), "payload": j},
+    )
+    webhook_router.run_inline(j)
+    if not webhook_router.has_async(j):
+        WEBHOOKS.inc(outcome="inline")
+        span.set_attribute("webhook.outcome", "inline")
+        return {"job_id": None}
+
+    # Redeliveries reuse the delivery id; fall back to the payload hash.
+    delivery_id = request.headers.get("linear-delivery") or hashlib.sha256(body).hexdigest()
+    job_id, created = await job_queue.enqueue(
+        "linear_webhook",
+        j,
+        dedup_key=delivery_id,
+        serial_key=webhook_issue_id(j),
+        coalesce_key=webhook_coalesce_key(j),
+    )
+    outcome = "enqueued" if created else "duplicate"
+    WEBHOOKS.inc(outcome=outcome)
+    span.set_attribute("webhook.outcome", outcome)
+    span.set_attribute("job.id", job_id)
+    return {"job_id": job_id, "duplicate": not created}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: int) -> JobStatus:
+    """Get the status of a background job"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# Webhook handlers. Synchronous ones run inline when the webhook arrives;
+# coroutines run on the job queue.
+webhook_router = WebhookRouter()
+
+# Label, workflow state, user and team changes invalidate cached reference data.
+webhook_router.add(
+    linear_client.cache.handle_webhook,
+    type=tuple(linear_client.cache.WEBHOOK_INVALIDATIONS),
+)
+webhook_router.add(
+    response_cache.handle_webhook, type=tuple(ResponseCache.WEBHOOK_INVALIDATIONS)
+)
+if sync_engine is not None:
+    webhook_router.add(sync_engine.handle_webhook, type=tuple(WEBHOOK_TABLES))
+
+ROBOT_NAME = "AutoPM Robot"
+
 
-    is_update = j["action"] == "update"
-    is_create = j["action"] == "create"
+def is_from_robot(j) -> bool:
+    return (j["data"].get("user") or {}).get("name") == ROBOT_NAME
+
+
+def is_assignment_to_robot(j) -> bool:
     assignee_changed = "assigneeId" in j.get("updatedFrom", {})
-    assigned_to_robot = j["data"].get("assignee", {}).get("name") == "AutoPM Robot"
-    is_comment = j["type"] == "Comment"
-    status_changed = "stateId" in j.get("updatedFrom", {})
-
-    # TODO: use something like cachetools here
-    # all_issue_labels = linear_client.list_issue_labels()
-
-    is_from_robot = j["data"].get("user", {}).get("name") == "AutoPM Robot"
-    if all([is_create, is_comment, not is_from_robot]):
-        import json
-
-        print(json.dumps(j, indent=2))
-        issue = await linear_client.get_issue(j["data"]["issueId"])
-        # If a new comment arrives, and it's assigned to the robot, then we should perform a chat completion.
-        # if issue.assignee and issue.assignee.name == "AutoPM Robot":
-        #     print("Comment on robot-assigned issue")
-        labels = []
-        if issue.labels:
-            labels = issue.labels.nodes
-        label_ids = append_label_id_by_name(all_issue_labels, labels, "🤖")
-        await linear_client.update_issue(
-            issue.id, IssueModificationInput(label_ids=label_ids)
-        )
-        result = await agent_router.handle_new_comment(issue)
-
-        print("result:", result)
-        parts = result.split("ΔDESCRIPTION: ")
-        comment = parts[0].replace("COMMENT:", "").strip()
-        print("parts:", parts)
-        print("comment:", comment)
-        print("creating comment")
-        await linear_client.create_comment(
+    return assignee_changed and (j["data"].get("assignee") or {}).get("name") == ROBOT_NAME
+
+
+@webhook_router.route(type="Comment", action="create", when=lambda j: not is_from_robot(j))
+async def on_new_comment(j):
+    logger.info(
+        "new comment", extra={"comment_id": j["data"]["id"], "issue_id": j["data"]["issueId"]}
+    )
+    issue = await linear_client.get_issue(j["data"]["issueId"])
+    # If a new comment arrives, and it's assigned to the robot, then we should perform a chat completion.
+    # if issue.assignee and issue.assignee.name == "AutoPM Robot":
+    #     print("Comment on robot-assigned issue")
+    await update_issue_labels(issue.id, add="🤖")
+    result = await agent_router.handle_new_comment(issue)
+
+    logger.debug("comment response", extra={"completion": result})
+    parts = result.split("ΔDESCRIPTION: ")
+    comment = parts[0].replace("COMMENT:", "").strip()
+    new_description = None
+    if len(parts) > 1:
+        description = parts[1].strip()
+        if len(description) > 10 and description != issue.description:
+            new_description = description
+    logger.info(
+        "replying to comment",
+        extra={"issue_id": issue.id, "updates_description": new_description is not None},
+    )
+    await asyncio.gather(
+        linear_client.create_comment(
             CommentCreateInput(
                 body=comment,
                 issue_id=issue.id,
                 parent_id=j["data"]["id"],
             )
-        )
-        if len(parts) > 1:
-            description = parts[1].strip()
-            if len(description) > 10 and description != issue.description:
-                print("updating description")
-                await linear_client.update_issue(
-                    issue.id,
-                    IssueModificationInput(
-                        description=description,
-                        label_ids=remove_label_by_name(labels, "🤖"),
-                    ),
+        ),
+        update_issue_labels(issue.id, remove="🤖", description=new_description),
+    )
+
+
+def agent_output_stream(issue_id: str) -> Optional[ThrottledWriter]:
+    """Streams agent output into a robot comment or the issue description,
+    as configured by AGENT_STREAM_TARGET."""
+    target = settings.agent_stream_target
+    if target == "comment":
+        comment_id = None
+
+        async def write(text: str):
+            nonlocal comment_id
+            if comment_id is None:
+                comment = await linear_client.create_comment(
+                    CommentCreateInput(body=text, issue_id=issue_id)
                 )
-        await linear_client.update_issue(
-            issue.id,
-            IssueModificationInput(
-                label_ids=remove_label_by_name(labels, "🤖"),
-            ),
-        )
+                comment_id = comment.id
+            else:
+                await linear_client.update_comment(comment_id, text)
 
-    updated_to = j.get("data", {}).get("state")
+        async def discard():
+            if comment_id is not None:
+                await linear_client.delete_comment(comment_id)
 
-    if type(updated_to) == str or not updated_to:
-        return
-    updated_to_friendly = status_reversed.get(updated_to.get("id"), None)
-    issue_placed_in_review = updated_to_friendly == "in_review"
+    elif target == "description":
 
-    if all([is_update, assignee_changed, assigned_to_robot]):
-        print("Assigning to AI")
-        issue = await linear_client.get_issue(j["data"]["id"])
+        async def write(text: str):
+            await linear_client.update_issue(issue_id, IssueModificationInput(description=text))
 
-        prior_state = status_reversed.get(issue.state.id, "todo")
+        # finish_robot_assignment puts the original description back.
+        discard = None
 
-        labels = []
-        if issue.labels:
-            lables = issue.labels.nodes
-        label_ids = append_label_id_by_name(all_issue_labels, lables, "🤖")
-        await linear_client.update_issue(
-            j["data"]["id"], IssueModificationInput(state="in_progress")
-        )
-        print(
-            "set new labels:",
-            await linear_client.update_issue(
-                j["data"]["id"],
-                IssueModificationInput(label_ids=label_ids),
-            ),
-        )
+    else:
+        return None
+    return ThrottledWriter(
+        write,
+        interval=settings.agent_stream_interval,
+        min_chars=settings.agent_stream_min_chars,
+        discard=discard,
+    )
 
-        print("ROUTER START!")
-        result = await agent_router.accomplish_issue(issue)
-        print("ROUTER END!")
 
+@webhook_router.route(type="Issue", action="update", changed="assigneeId", when=is_assignment_to_robot)
+async def on_robot_assignment(j):
+    logger.info("issue assigned to the robot", extra={"issue_id": j["data"]["id"]})
+    issue = await linear_client.get_issue(j["data"]["id"], max_staleness=0)
+    if not (issue.assignee and issue.assignee.name == ROBOT_NAME):
+        # E.g. a retry after the robot already handed the issue back.
+        logger.info("issue no longer assigned to the robot", extra={"issue_id": issue.id})
+        return
+
+    prior_state = IssueState.from_state_name(issue.state.name) or IssueState.TODO
+
+    await update_issue_labels(j["data"]["id"], add="🤖", state="in_progress")
+
+    stream = agent_output_stream(issue.id)
+    try:
+        result = await agent_router.accomplish_issue(issue, stream=stream)
+    except Exception:
+        # Undo the partial output, the 🤖 label and the assignment. The job
+        # only fails, and is retried, if that cleanup fails too: a retry of
+        # a cleaned up issue would run the agent on an unassigned issue.
+        logger.exception("robot failed on the issue", extra={"issue_id": issue.id})
+        await finish_robot_assignment(issue, prior_state, stream, None)
+        return
+    logger.info(
+        "robot finished the issue",
+        extra={"issue_id": issue.id, "succeeded": bool(result)},
+    )
+    await finish_robot_assignment(issue, prior_state, stream, result)
+
+
+async def finish_robot_assignment(
+    issue: Issue, prior_state: IssueState, stream: Optional[ThrottledWriter], result: Optional[str]
+):
+    """Writes the robot's result, or undoes its partial output, and hands the issue back."""
+    # Let a partial write in flight land before the final update.
+    streamed = False
+    if stream is not None:
+        await stream.finish()
+        streamed = stream.writes > 0
+    if streamed and settings.agent_stream_target == "comment":
+        # The result goes into the description only; the comment that
+        # showed it being written points there, or goes away on failure.
         if result:
-            await linear_client.update_issue(
-                j["data"]["id"],
-                IssueModificationInput(
-                    description=result,
-                    state="in_review",
-                    label_ids=remove_label_by_name(lables, "🤖"),
-                ),
-            )
+            await stream.finish("The robot finished this issue: see the description.")
         else:
-            await linear_client.update_issue(
-                j["data"]["id"],
-                IssueModificationInput(
-                    state=prior_state, label_ids=remove_label_by_name(lables, "🤖")
-                ),
-            )
-        print(await linear_client.assign_issue(j["data"]["id"], None))
+            await stream.discard()
+    if result:
+        await update_issue_labels(
+            issue.id, remove="🤖", unassign=True, description=result, state="in_review"
+        )
+    else:
+        changes = {}
+        if streamed and settings.agent_stream_target == "description":
+            # Put back the description the partial output replaced.
+            changes["description"] = issue.description or ""
+        await update_issue_labels(
+            issue.id, remove="🤖", unassign=True, state=prior_state, **changes
+        )
 
-    elif all([is_update, status_changed, issue_placed_in_review]):
-        print("considering issue evaluator")
-        issue = await linear_client.get_issue(j["data"]["id"])
 
-        child_issues = []
-        if issue.parent:
-            child_issues = await linear_client.list_issues(
-                parent={"id": {"eq": issue.parent.id}},
-            )
+@webhook_router.route(
+    type="Issue", action="update", changed="stateId", when=lambda j: not is_assignment_to_robot(j)
+)
+async def on_issue_state_change(j):
+    updated_to = j.get("data", {}).get("state")
+    if type(updated_to) == str or not updated_to:
+        return
+    updated_to_state = IssueState.from_state_name(
+        await linear_client.cache.state_name(updated_to.get("id"))
+    )
+    if updated_to_state != IssueState.IN_REVIEW:
+        return
 
-        child_issues = [
-            {"title": i.title, "status": i.state.name}
-            for i in child_issues
-            if i.id != issue.id
-        ]
+    logger.info("evaluating issue placed in review", extra={"issue_id": j["data"]["id"]})
+    issue = await linear_client.get_issue(
+        j["data"]["id"], fields=EVALUATION_ISSUE_FIELDS
+    )
 
-        labels = []
-        if issue.labels:
-            lables = issue.labels.nodes
-        label_ids = append_label_id_by_name(all_issue_labels, lables, "Evaluating")
-        print(
-            "set new labels:",
-            await linear_client.update_issue(
-                j["data"]["id"],
-                IssueModificationInput(label_ids=label_ids),
-            ),
+    child_issues = []
+    if issue.parent:
+        child_issues = await linear_client.list_issues(
+            fields=SIBLING_ISSUE_FIELDS,
+            parent={"id": {"eq": issue.parent.id}},
         )
-        eval_result = await agent_router.evaluate_issue_completion(issue, child_issues)
-        if eval_result:
-            await linear_client.update_issue(
-                j["data"]["id"],
-                IssueModificationInput(
-                    state="done",
-                    label_ids=remove_label_by_name(lables, "Evaluating"),
-                ),
-            )
-        else:
-            await linear_client.update_issue(
-                j["data"]["id"],
-                IssueModificationInput(
-                    label_ids=remove_label_by_name(lables, "Evaluating"),
-                ),
-            )
-        print("eval result:", eval_result)
-    return "ok"
+
+    child_issues = [
+        {"title": i.title, "status": i.state.name}
+        for i in child_issues
+        if i.id != issue.id
+    ]
+
+    await update_issue_labels(j["data"]["id"], add="Evaluating")
+    eval_result = await agent_router.evaluate_issue_completion(issue, child_issues)
+    if eval_result:
+        await update_issue_labels(j["data"]["id"], remove="Evaluating", state="done")
+    else:
+        await update_issue_labels(j["data"]["id"], remove="Evaluating")
+    logger.info(
+        "issue evaluated", extra={"issue_id": j["data"]["id"], "completed": bool(eval_result)}
+    )
+
+
+job_queue.register("linear_webhook", webhook_router.run_async)
 
 
 @app.post(
@@ -331,15 +642,17 @@ async def webhooks_linear(request: Request):
 )
 async def assign_issue(input: AssignIssueInput):
     """Assign an issue to a user"""
-    response = await linear_client.assign_issue(input.issue_id, input.assignee_id)
+    async with issue_locks(input.issue_id):
+        response = await linear_client.assign_issue(input.issue_id, input.assignee_id)
+    response_cache.invalidate("issues")
     return response
 
 
 @app.get("/users/", response_model=List[User], response_model_exclude_none=True)
 async def list_users() -> List[User]:
     """List all users"""
-    response = linear_client.list_users()
-    return response
+    response = await linear_client.cache.users.get()
+    return list_response(response)
 
 
 @app.get(
@@ -347,15 +660,15 @@ async def list_users() -> List[User]:
 )
 async def list_issue_labels() -> List[IssueLabel]:
     """List all issue labels"""
-    response = linear_client.list_issue_labels()
-    return response
+    response = await linear_client.cache.issue_labels.get()
+    return list_response(response)
 
 
 @app.get("/projects", response_model=List[Project], response_model_exclude_none=True)
-async def list_projects() -> List[Project]:
+async def list_projects(request: Request) -> List[Project]:
     """List all projects"""
-    response = await linear_client.list_projects()
-    return response
+    cached = await response_cache.get("projects", None, linear_client.list_projects)
+    return response_cache.respond(request, cached)
 
 
 @app.get(
@@ -371,6 +684,7 @@ async def get_project(project_id: str) -> Project:
 async def create_project(input: ProjectInput) -> Project:
     """Create a project"""
     response = await linear_client.create_project(input)
+    response_cache.invalidate("projects")
     return response
 
 
@@ -380,6 +694,7 @@ async def create_project(input: ProjectInput) -> Project:
 async def update_project(project_id: str, input: ProjectInput) -> Project:
     """Update a project"""
     response = await linear_client.update_project(project_id, input)
+    response_cache.invalidate("projects")
     return response
 
 
@@ -389,6 +704,7 @@ async def update_project(project_id: str, input: ProjectInput) -> Project:
 async def delete_project(project_id: str) -> Project:
     """Delete a project"""
     response = await linear_client.delete_project(project_id)
+    response_cache.invalidate("projects")
     return response
 
 
@@ -409,10 +725,12 @@ asset_mount = modal.Mount.from_local_file(
     response_model=List[Document],
     response_model_exclude_none=True,
 )
-async def list_documents(project_id: str) -> List[Document]:
+async def list_documents(request: Request, project_id: str) -> List[Document]:
     """List all documents (AKA product specifications)."""
-    response = await linear_client.list_documents(project_id)
-    return response
+    cached = await response_cache.get(
+        "documents", project_id, lambda: linear_client.list_documents(project_id)
+    )
+    return response_cache.respond(request, cached)
 
 
 @app.get(
@@ -434,6 +752,7 @@ async def get_document(project_id: str, document_id: str) -> Document:
 async def create_document(project_id: str, input: DocumentInput) -> Document:
     """Create a document"""
     response = await linear_client.create_document(project_id, input)
+    response_cache.invalidate("documents")
     return response
 
 
@@ -447,6 +766,7 @@ async def update_document(
 ) -> Document:
     """Update a document"""
     response = await linear_client.update_document(document_id, input)
+    response_cache.invalidate("documents")
     return response
 
 
@@ -458,6 +778,7 @@ async def update_document(
 async def delete_document(project_id: str, document_id: str) -> Document:
     """Delete a document"""
     response = await linear_client.delete_document(project_id, document_id)
+    response_cache.invalidate("documents")
     return response
 
 
@@ -470,7 +791,7 @@ async def delete_document(project_id: str, document_id: str) -> Document:
 async def list_milestones(project_id: str) -> List[ProjectMilestone]:
     """List all milestones."""
     response = await linear_client.list_milestones(project_id)
-    return response
+    return list_response(response)
 
 
 @app.get(
@@ -494,6 +815,7 @@ async def create_milestone(
 ) -> ProjectMilestone:
     """Create a milestone"""
     response = await linear_client.create_milestone(project_id, input)
+    response_cache.invalidate("projects")
     return response
 
 
@@ -507,6 +829,7 @@ async def update_milestone(
 ) -> ProjectMilestone:
     """Update a milestone"""
     response = await linear_client.update_milestone(milestone_id, input)
+    response_cache.invalidate("projects")
     return response
 
 
@@ -518,6 +841,7 @@ async def update_milestone(
 async def delete_milestone(project_id: str, milestone_id: str) -> bool:
     """Delete a milestone"""
     response = await linear_client.delete_milestone(milestone_id)
+    response_cache.invalidate("projects")
     return response
 
 
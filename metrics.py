@@ -0,0 +1,208 @@
+"""A small in-process metrics registry rendered in the Prometheus text format.
+
+Counters, gauges and histograms take label values as keyword arguments.
+Values that already live elsewhere (queue depths, scheduler stats) can be
+exported with `set_function`, which is called at scrape time.
+
+Example usage:
+
+    GRAPHQL_SECONDS = histogram(
+        "linear_graphql_duration_seconds", "Linear GraphQL round trips", ["operation"]
+    )
+    with GRAPHQL_SECONDS.time(operation="Issues"):
+        ...
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+"""
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans fast Linear calls through slow LLM completions.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+Sample = Union[float, Dict[LabelValues, float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._function: Optional[Callable[[], Sample]] = None
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def set_function(self, function: Callable[[], Sample]):
+        """Reads the value at scrape time: a number, or {label values: number}."""
+        self._function = function
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) triples."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _Value(Metric):
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        values = self._values
+        if self._function is not None:
+            sample = self._function()
+            values = sample if isinstance(sample, dict) else {(): sample}
+        return [
+            ("", _format_labels(self.label_names, key), value) for key, value in values.items()
+        ]
+
+
+class Counter(_Value):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Value):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[len(self.buckets)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block, also when it raises."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def samples(self):
+        samples = []
+        for key, counts in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                labels = _format_labels(
+                    (*self.label_names, "le"), (*key, _format_value(bound))
+                )
+                samples.append(("_bucket", labels, cumulative))
+            labels = _format_labels(self.label_names, key)
+            samples.append(("_sum", labels, counts[-1]))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            # Re-imports (e.g. uvicorn --reload) get the existing metric.
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labels))  # type: ignore[return-value]
+
+
+def gauge(name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labels))  # type: ignore[return-value]
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labels: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))  # type: ignore[return-value]
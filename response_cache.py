@@ -0,0 +1,109 @@
+"""Server-side cache of rendered list responses, with ETags.
+
+Clients like the ChatGPT plugin poll the list endpoints. The rendered body
+of each (kind, key), e.g. ("documents", project_id), is cached with a TTL
+(see linear_cache.CachedValue) and dropped when a Linear webhook or one of
+our own writes changes the underlying objects. Each body gets a strong ETag
+hashed from its bytes, so a poll with a matching If-None-Match gets a 304
+without the body being re-sent or Linear being asked at all.
+
+Unlike reference data, a response past its TTL is re-rendered before it is
+returned, so an ETag is never confirmed from an expired body. At most
+`max_entries` responses are kept; the least recently used go first.
+
+Example usage:
+
+    cached = await response_cache.get("projects", None, linear_client.list_projects)
+    return response_cache.respond(request, cached)
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Tuple
+
+from fastapi import Request, Response
+
+from linear_cache import CachedValue
+from responses import dumps
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as RFC 9110 specifies for If-None-Match."""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+
+class ResponseCache:
+    # Linear webhook `type` -> the kinds of cached response it affects.
+    # Issue lists embed workflow state, label and assignee names.
+    WEBHOOK_INVALIDATIONS = {
+        "Issue": ("issues",),
+        "IssueLabel": ("issues",),
+        "WorkflowState": ("issues",),
+        "User": ("issues",),
+        "Project": ("projects",),
+        "ProjectMilestone": ("projects", "issues"),
+        "Document": ("documents",),
+    }
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Least recently used first.
+        self._entries: "OrderedDict[Tuple[str, Hashable], CachedValue[CachedResponse]]" = OrderedDict()
+
+    async def get(
+        self, kind: str, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> CachedResponse:
+        """Returns the cached response for (kind, key), rendering what
+        `loader` returns if there is none or it has expired."""
+        entry = self._entries.get((kind, key))
+        if entry is None:
+
+            async def render() -> CachedResponse:
+                body = dumps(await loader())
+                return CachedResponse(body, etag_for(body))
+
+            self._make_room()
+            entry = self._entries[(kind, key)] = CachedValue(render, self.ttl)
+        else:
+            self._entries.move_to_end((kind, key))
+        if entry.expired:
+            return await entry.refresh()
+        return await entry.get()
+
+    def _make_room(self):
+        """Drops expired entries, then the least recently used, to fit one more."""
+        if len(self._entries) < self.max_entries:
+            return
+        for entry_key in [k for k, entry in self._entries.items() if entry.expired]:
+            self._entries.pop(entry_key).invalidate()
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)[1].invalidate()
+
+    def invalidate(self, kind: str):
+        for entry_key in [k for k in self._entries if k[0] == kind]:
+            self._entries.pop(entry_key).invalidate()
+
+    def handle_webhook(self, payload: Dict[str, Any]) -> bool:
+        kinds = self.WEBHOOK_INVALIDATIONS.get(payload.get("type", ""), ())
+        for kind in kinds:
+            self.invalidate(kind)
+        return bool(kinds)
+
+    @staticmethod
+    def respond(request: Request, cached: CachedResponse) -> Response:
+        headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match", ""), cached.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(cached.body, media_type="application/json", headers=headers)
@@ -0,0 +1,31 @@
+"""orjson-backed JSON responses.
+
+ModelJSONResponse is the app's default response class. Besides whatever
+FastAPI has already converted to plain data, it renders pydantic models
+directly, leaving out None fields like `response_model_exclude_none` does.
+This is what endpoints that bypass response_model validation use.
+
+Example usage:
+
+    return ModelJSONResponse(issues)
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.dict(exclude_none=True)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+class ModelJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
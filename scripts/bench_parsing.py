@@ -0,0 +1,96 @@
+"""Benchmarks turning a large issue list payload into an API response.
+
+Compares the validated path (`Issue(**node)`, then FastAPI re-validating
+against `response_model`) with trusted mode (`construct_model`, then
+serializing the models directly), on synthetic payloads shaped like the
+"list_issues" query's result.
+
+Example usage:
+
+    python scripts/bench_parsing.py
+    python scripts/bench_parsing.py --issues 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from linear_construct import construct_model  # noqa: E402
+from linear_types import Issue  # noqa: E402
+
+
+def issue_node(i: int) -> dict:
+    return {
+        "id": f"issue-{i}",
+        "identifier": f"ENG-{i}",
+        "title": f"Issue number {i}",
+        "description": "Some description of the work to be done. " * 5,
+        "priority": float(i % 5),
+        "state": {"id": f"state-{i % 6}", "name": "In Progress"},
+        "assignee": {"id": f"user-{i % 20}", "name": "Someone"} if i % 3 else None,
+        "parent": {"id": f"issue-{i // 10}", "identifier": f"ENG-{i // 10}"},
+        "labels": {"nodes": [{"id": f"label-{j}", "name": f"label {j}"} for j in range(i % 4)]},
+        "children": {"nodes": []},
+    }
+
+
+def timed(label: str, fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<32} {best * 1000:9.1f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--issues", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    nodes = [issue_node(i) for i in range(args.issues)]
+    # Parse a fresh copy of the payload every time, like a real response.
+    body = json.dumps({"data": {"issues": {"nodes": nodes}}})
+    field = create_response_field(name="Response_list_issues", type_=List[Issue])
+
+    def response_nodes():
+        return json.loads(body)["data"]["issues"]["nodes"]
+
+    def validated():
+        issues = [Issue(**node) for node in response_nodes()]
+        content = asyncio.run(
+            serialize_response(field=field, response_content=issues, exclude_none=True)
+        )
+        return json.dumps(content)
+
+    def trusted():
+        issues = [construct_model(Issue, node) for node in response_nodes()]
+        return json.dumps([issue.dict(exclude_none=True) for issue in issues])
+
+    assert json.loads(validated()) == json.loads(trusted())
+
+    print(f"{args.issues} issues, best of {args.repeat}:")
+    timed("json.loads only", response_nodes, args.repeat)
+    timed("parse: Issue(**node)", lambda: [Issue(**n) for n in response_nodes()], args.repeat)
+    timed(
+        "parse: construct_model",
+        lambda: [construct_model(Issue, n) for n in response_nodes()],
+        args.repeat,
+    )
+    slow = timed("end to end: validated", validated, args.repeat)
+    fast = timed("end to end: trusted", trusted, args.repeat)
+    print(f"  trusted mode is {slow / fast:.1f}x faster end to end")
+
+
+if __name__ == "__main__":
+    main()
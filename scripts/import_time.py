@@ -0,0 +1,90 @@
+"""Measures cold import time of the app's modules, to keep startup in budget.
+
+Each module is imported in a fresh interpreter with `-X importtime`, so
+nothing is shared between measurements. Exits non-zero if a module is over
+its budget, or if importing it pulls in one of the large generated type
+modules, which should only be imported by the code that needs them.
+
+Example usage:
+
+    python scripts/import_time.py
+    python scripts/import_time.py --budget 1.5 --top 20 main
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ["linear_types", "linear_client", "main"]
+LAZY_MODULES = ["linear_raw_types", "linear_comparison_types"]
+
+
+def measure(module: str):
+    """Returns (total seconds, [(cumulative seconds, module)], error)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        # Nested imports are indented below the module importing them.
+        timings.append((int(cumulative_us) / 1e6, name[1:]))
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+    total = next((t for t, name in timings if name == module), 0.0)
+    return total, timings, error
+
+
+def direct_imports(timings, module: str):
+    """The imports made directly by `module`. -X importtime lists a module
+    after everything it imports, each nesting level indented two spaces."""
+    children = []
+    for seconds, name in timings:
+        if not name.startswith(" "):
+            if name == module:
+                return children
+            children = []
+        elif not name.startswith("   "):
+            children.append((seconds, name.strip()))
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument(
+        "--budget", type=float, default=2.0, help="seconds allowed per module"
+    )
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to show")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        total, timings, error = measure(module)
+        if error:
+            print(f"{module}: import failed: {error}")
+            failed = True
+            continue
+        status = "ok" if total <= args.budget else "OVER BUDGET"
+        print(f"{module}: {total:.3f}s (budget {args.budget:.3f}s) {status}")
+        failed = failed or total > args.budget
+        for seconds, name in sorted(direct_imports(timings, module), reverse=True)[: args.top]:
+            print(f"  {seconds:8.3f}s  {name}")
+        loaded = {name.strip() for _, name in timings}
+        for lazy in LAZY_MODULES:
+            if lazy in loaded and lazy != module:
+                print(f"  {lazy} was imported eagerly")
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
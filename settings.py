@@ -0,0 +1,123 @@
+"""Application settings, read from the environment (and .env) once at startup.
+
+Example usage:
+
+    settings = Settings()
+    if settings.setup_done:
+        team_id = await settings.resolve_team_id(linear_client)
+"""
+import asyncio
+import logging
+from typing import Dict, Literal, Optional
+
+from dotenv import set_key
+from pydantic import BaseSettings
+
+logger = logging.getLogger(__name__)
+
+
+class Settings(BaseSettings):
+    linear_api_key: Optional[str] = None
+    openai_api_key: Optional[str] = None
+    serpapi_api_key: Optional[str] = None
+    linear_team_name: Optional[str] = None
+    linear_team_id: Optional[str] = None
+
+    # Build models from Linear's responses without validating them.
+    linear_trusted_payloads: bool = False
+
+    # Seconds list responses are served from cache before being refreshed.
+    response_cache_ttl: float = 60.0
+    # Rendered list responses kept, e.g. one per project's documents.
+    response_cache_max_entries: int = 1000
+    # Responses smaller than this many bytes are sent uncompressed.
+    compression_minimum_size: int = 1024
+
+    linear_mirror_path: Optional[str] = None
+    linear_mirror_max_staleness: float = 60.0
+    job_queue_path: str = "jobs.sqlite3"
+    job_queue_workers: int = 4
+    # Seconds finished jobs are kept, e.g. for GET /jobs/{id}.
+    job_queue_retention: float = 7 * 24 * 3600
+
+    log_level: str = "INFO"
+    # Probability that a DEBUG/INFO log record is kept.
+    log_sample_rate: float = 1.0
+    # Verbose traces: DEBUG level, no sampling, full request/response bodies.
+    debug: bool = False
+    # Appends OTLP/JSON spans here when set, see tracing.
+    traces_path: Optional[str] = None
+
+    # Local agent selection, see agents.agent_classifier. Issues classified
+    # with less confidence than the threshold go to the LLM router.
+    agent_classifier_enabled: bool = True
+    agent_classifier_threshold: float = 0.75
+    # The fraction of confidently classified issues still sent to the LLM
+    # router, so the classifiers keep learning.
+    agent_classifier_explore_rate: float = 0.1
+    # The held-out accuracy the naive Bayes classifier needs to be used.
+    agent_classifier_min_accuracy: float = 0.9
+    # Routing decisions the naive Bayes classifier is trained on.
+    routing_log_path: str = "routing.jsonl"
+
+    # Completions of temperature 0 LLM calls, see agents.llm_cache. An
+    # empty path turns the cache off.
+    llm_cache_path: Optional[str] = "llm_cache.sqlite3"
+    llm_cache_ttl: float = 7 * 24 * 3600
+    llm_cache_max_entries: int = 10000
+
+    # Per-model limits of the LLM dispatcher, see agents.llm_dispatcher, as
+    # JSON in the environment, e.g. LLM_CONCURRENCY='{"gpt-4": 2}'.
+    llm_concurrency: Dict[str, int] = {"gpt-4": 4, "gpt-3.5-turbo": 8}
+    llm_tokens_per_minute: Dict[str, float] = {"gpt-4": 40000, "gpt-3.5-turbo": 90000}
+
+    # Where agents working on an assigned issue stream their output while
+    # it is generated: "comment", "description" or "off". The result is
+    # written to the description when they finish either way.
+    agent_stream_target: Literal["comment", "description", "off"] = "comment"
+    # Partial output is written at most every interval seconds, unless
+    # min_chars new characters have arrived.
+    agent_stream_interval: float = 2.0
+    agent_stream_min_chars: int = 500
+
+    # Where a team id resolved from LINEAR_TEAM_NAME is persisted.
+    env_file_path: str = ".env"
+
+    class Config:
+        env_file = ".env"
+        underscore_attrs_are_private = True
+
+    _team_id_task: Optional[asyncio.Task] = None
+
+    @property
+    def setup_done(self) -> bool:
+        return bool(
+            self.linear_api_key
+            and self.openai_api_key
+            and self.serpapi_api_key
+            and (self.linear_team_name or self.linear_team_id)
+        )
+
+    async def resolve_team_id(self, linear_client) -> str:
+        """Returns the team id, looking it up by LINEAR_TEAM_NAME the first
+        time. Concurrent callers share one lookup; a failed lookup is retried
+        by the next caller."""
+        if self.linear_team_id:
+            return self.linear_team_id
+        if self._team_id_task is None:
+            self._team_id_task = asyncio.ensure_future(self._lookup_team_id(linear_client))
+        task = self._team_id_task
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if self._team_id_task is task:
+                self._team_id_task = None
+            raise
+
+    async def _lookup_team_id(self, linear_client) -> str:
+        logger.info("team ID not set, getting it from linear")
+        team_id = await linear_client.get_linear_team_id(self.linear_team_name)
+        set_key(self.env_file_path, "LINEAR_TEAM_ID", team_id)
+        self.linear_team_id = team_id
+        linear_client.cache.workflow_states.invalidate()
+        return team_id
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from agents.agent_classifier import AgentClassifier, KeywordClassifier, NaiveBayesClassifier
+from linear_types import Issue
+
+TOPICS = {
+    "GPT35": ["typo", "rename", "wording", "readme", "spelling"],
+    "issue_creator": ["epic", "roadmap", "breakdown", "milestone", "plan"],
+}
+
+
+def issue(title: str) -> Issue:
+    return Issue(id="issue", title=title)
+
+
+def examples(count: int, seed: int = 0, shuffle_labels: bool = False):
+    rng = random.Random(seed)
+    agents = sorted(TOPICS)
+    for _ in range(count):
+        agent = rng.choice(agents)
+        text = " ".join(rng.choices(TOPICS[agent], k=4))
+        yield text, rng.choice(agents) if shuffle_labels else agent
+
+
+def test_abstains_until_enough_held_out_predictions():
+    classifier = NaiveBayesClassifier(min_examples=20)
+    classifier.fit(examples(10))
+    assert classifier.classify(issue("fix the typo")) is None
+    classifier.fit(examples(30, seed=1))
+    assert len(classifier.outcomes) >= 20
+    prediction = classifier.classify(issue("fix the typo"))
+    assert prediction is not None
+    assert prediction.agent == "GPT35"
+    assert prediction.confidence > 0.5
+
+
+def test_abstains_while_inaccurate():
+    classifier = NaiveBayesClassifier(min_examples=20)
+    classifier.fit(examples(200, shuffle_labels=True))
+    assert classifier.accuracy < classifier.min_accuracy
+    assert classifier.classify(issue("fix the typo")) is None
+
+
+def test_confidence_does_not_grow_with_length():
+    classifier = NaiveBayesClassifier(min_examples=20)
+    classifier.fit(examples(100))
+    short = classifier.classify(issue("typo roadmap typo"))
+    long = classifier.classify(issue(" ".join(["typo roadmap typo"] * 20)))
+    assert short.confidence == pytest.approx(long.confidence)
+    assert short.confidence < 0.9
+
+
+def test_keyword_classifier():
+    prediction = KeywordClassifier().classify(issue("Please break this down into sub-issues"))
+    assert prediction.agent == "issue_creator"
+    assert KeywordClassifier().classify(issue("Something else")) is None
+
+
+def test_classify_is_abstract():
+    with pytest.raises(TypeError):
+        AgentClassifier()
@@ -0,0 +1,112 @@
+import asyncio
+
+from job_queue import DONE, FAILED, JobQueue
+
+
+def make_queue(tmp_path, **kwargs) -> JobQueue:
+    kwargs.setdefault("poll_interval", 0.01)
+    kwargs.setdefault("retry_backoff", 0.05)
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+async def run_until(queue: JobQueue, done, timeout: float = 2.0):
+    """Runs the workers until `done()` holds."""
+    queue.start()
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not done():
+            assert asyncio.get_running_loop().time() < deadline, "timed out"
+            await asyncio.sleep(0.01)
+    finally:
+        await queue.stop()
+
+
+def test_dedup_key_returns_the_existing_job(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path)
+        first = await queue.enqueue("kind", {"n": 1}, dedup_key="delivery")
+        second = await queue.enqueue("kind", {"n": 2}, dedup_key="delivery")
+        assert first == (first[0], True)
+        assert second == (first[0], False)
+        assert queue.depth() == 1
+
+    asyncio.run(main())
+
+
+def test_coalesced_job_keeps_every_dedup_key(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path)
+        seen = []
+
+        async def handler(payload):
+            seen.append(payload)
+
+        queue.register("kind", handler)
+        job_id, _ = await queue.enqueue("kind", "old", dedup_key="d1", coalesce_key="issue")
+        assert await queue.enqueue("kind", "new", dedup_key="d2", coalesce_key="issue") == (job_id, False)
+        # Redeliveries of either webhook are duplicates, not newer payloads.
+        assert await queue.enqueue("kind", "old", dedup_key="d1", coalesce_key="issue") == (job_id, False)
+        assert await queue.enqueue("kind", "new", dedup_key="d2", coalesce_key="issue") == (job_id, False)
+        await run_until(queue, lambda: seen)
+        assert seen == ["new"]
+
+    asyncio.run(main())
+
+
+def test_serial_jobs_run_in_order_across_retries(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path, workers=4)
+        ran = []
+        failures = {"a1"}
+
+        async def handler(payload):
+            if payload in failures:
+                failures.discard(payload)
+                raise RuntimeError(payload)
+            ran.append(payload)
+
+        queue.register("kind", handler)
+        await queue.enqueue("kind", "a1", serial_key="a")
+        await queue.enqueue("kind", "a2", serial_key="a")
+        await queue.enqueue("kind", "b1", serial_key="b")
+        await run_until(queue, lambda: len(ran) == 3)
+        assert [payload for payload in ran if payload.startswith("a")] == ["a1", "a2"]
+
+    asyncio.run(main())
+
+
+def test_failed_jobs_are_retried_up_to_max_attempts(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path)
+        attempts = []
+
+        async def handler(payload):
+            attempts.append(payload)
+            raise RuntimeError("boom")
+
+        queue.register("kind", handler, max_attempts=2)
+        job_id, _ = await queue.enqueue("kind", "x")
+        await run_until(queue, lambda: len(attempts) == 2)
+        job = await queue.get(job_id)
+        assert job["status"] == FAILED
+        assert job["attempts"] == 2
+
+    asyncio.run(main())
+
+
+def test_unknown_kind_fails_without_killing_the_worker(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path, workers=1)
+        ran = []
+
+        async def handler(payload):
+            ran.append(payload)
+
+        queue.register("kind", handler)
+        orphan_id, _ = await queue.enqueue("removed_kind", "x")
+        job_id, _ = await queue.enqueue("kind", "y")
+        await run_until(queue, lambda: ran)
+        assert (await queue.get(orphan_id))["status"] == FAILED
+        assert (await queue.get(job_id))["status"] == DONE
+
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+import asyncio
+
+from linear_batching import IssueUpdateBatcher
+
+
+class FakeLinear:
+    """Answers BatchIssueUpdate documents, recording each one."""
+
+    def __init__(self, errors=None):
+        self.calls = []
+        self.errors = errors or []
+
+    async def run_query(self, query, variables):
+        self.calls.append((query, variables))
+        count = len(variables) // 2
+        data = {
+            f"u{i}": {"success": True, "issue": {"id": variables[f"id{i}"]}}
+            for i in range(count)
+        }
+        return {"data": data, "errors": self.errors}
+
+
+def test_updates_to_one_issue_are_merged():
+    async def main():
+        linear = FakeLinear()
+        batcher = IssueUpdateBatcher(linear.run_query)
+        results = await asyncio.gather(
+            batcher.update_issue("a", {"stateId": "todo", "title": "x"}),
+            batcher.update_issue("a", {"stateId": "done"}),
+            batcher.update_issue("b", {"title": "y"}),
+        )
+        assert len(linear.calls) == 1
+        query, variables = linear.calls[0]
+        assert query.count("issueUpdate(") == 2
+        assert variables == {
+            "id0": "a",
+            "input0": {"stateId": "done", "title": "x"},
+            "id1": "b",
+            "input1": {"title": "y"},
+        }
+        assert results[0] == results[1] == {
+            "data": {"issueUpdate": {"success": True, "issue": {"id": "a"}}}
+        }
+        assert results[2]["data"]["issueUpdate"]["issue"] == {"id": "b"}
+
+    asyncio.run(main())
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    async def main():
+        linear = FakeLinear()
+        batcher = IssueUpdateBatcher(linear.run_query, window=60, max_batch_size=2)
+        await asyncio.wait_for(
+            asyncio.gather(
+                batcher.update_issue("a", {"title": "x"}),
+                batcher.update_issue("b", {"title": "y"}),
+            ),
+            timeout=1,
+        )
+        assert len(linear.calls) == 1
+
+    asyncio.run(main())
+
+
+def test_errors_go_to_the_update_they_belong_to():
+    async def main():
+        error = {"message": "not found", "path": ["u1"]}
+        linear = FakeLinear(errors=[error])
+        batcher = IssueUpdateBatcher(linear.run_query)
+        ok, failed = await asyncio.gather(
+            batcher.update_issue("a", {"title": "x"}),
+            batcher.update_issue("b", {"title": "y"}),
+        )
+        assert "data" in ok
+        assert failed == {"errors": [error]}
+
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from linear_construct import construct_model
+from linear_types import Issue
+
+ISSUE = {
+    "id": "issue-1",
+    "identifier": "ENG-1",
+    "title": "Fix it",
+    "description": None,
+    "priority": 2.0,
+    "assignee": {"id": "user-1", "name": "robot"},
+    "state": {"id": "state-1", "name": "Todo", "type": "unstarted"},
+    "labels": {"nodes": [{"id": "label-1", "name": "bug"}]},
+    "parent": {"id": "issue-0", "title": "Parent"},
+    "children": {"nodes": [{"id": "issue-2"}, None]},
+    "unknown": "ignored",
+}
+
+
+def test_matches_validation():
+    constructed = construct_model(Issue, ISSUE)
+    validated = Issue(**ISSUE)
+    assert constructed == validated
+    assert constructed.__fields_set__ == validated.__fields_set__
+    assert type(constructed.labels.nodes[0]) is type(validated.labels.nodes[0])
+    assert constructed.children.nodes[1] is None
+    assert not hasattr(constructed, "unknown")
+
+
+def test_missing_fields_get_their_defaults():
+    constructed = construct_model(Issue, {"id": "issue-1"})
+    assert constructed == Issue(id="issue-1")
+    assert constructed.__fields_set__ == {"id"}
+
+
+class Tagged(BaseModel):
+    tags: List[str] = []
+    extra: Dict[str, str] = Field(default_factory=dict)
+    note: Optional[str] = "none"
+
+
+def test_mutable_defaults_are_not_shared():
+    first = construct_model(Tagged, {})
+    second = construct_model(Tagged, {})
+    first.tags.append("a")
+    first.extra["a"] = "b"
+    assert second.tags == []
+    assert second.extra == {}
+    assert Tagged.__fields__["tags"].default == []
+    assert second.note == "none"
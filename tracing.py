@@ -0,0 +1,300 @@
+"""Lightweight OpenTelemetry-compatible tracing.
+
+Spans follow the OpenTelemetry data model: W3C trace and span ids, parent
+links, kinds, attributes, status and exception events. The current span
+lives in a context variable, so spans nest across awaits and each asyncio
+task gets its own. A span can be continued in another process or a later
+job through its W3C `traceparent`.
+
+Finished spans are exported by a background thread to a file of OTLP/JSON
+ExportTraceServiceRequest objects, one per line. That is the format the
+OpenTelemetry Collector's file exporter writes and its `otlpjsonfile`
+receiver reads, so traces can be examined offline or replayed into any
+OTLP backend. Tracing is off, and spans cost next to nothing, until
+`configure_tracing` is called with a path.
+
+Example usage:
+
+    configure_tracing("traces.jsonl")
+
+    with span("webhook", kind=SERVER, type=payload["type"]) as s:
+        s.set_attribute("outcome", "enqueued")
+
+    @traced()
+    async def GPT4(issue, **kwargs):
+        ...
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# OTLP SpanKind values.
+INTERNAL, SERVER, CLIENT, PRODUCER, CONSUMER = 1, 2, 3, 4, 5
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        kind: int,
+        attributes: Dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.events: List[dict] = []
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.events.append(
+            {
+                "timeUnixNano": str(time.time_ns()),
+                "name": "exception",
+                "attributes": _attributes(
+                    {
+                        "exception.type": type(exc).__name__,
+                        "exception.message": str(exc),
+                        "exception.stacktrace": "".join(
+                            traceback.format_exception(type(exc), exc, exc.__traceback__)
+                        ),
+                    }
+                ),
+            }
+        )
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def to_otlp(self) -> dict:
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "events": self.events,
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+class _NoopSpan:
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [
+        {"key": key, "value": _value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+def _parse_traceparent(traceparent: Optional[str]):
+    """Returns (trace id, parent span id) from a W3C traceparent."""
+    if not traceparent:
+        return None, None
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+class OTLPJsonFileExporter:
+    """Appends finished spans to `path` as OTLP/JSON, batched by a thread."""
+
+    def __init__(
+        self,
+        path: str,
+        service_name: str = "autopm",
+        max_batch_size: int = 512,
+        flush_interval: float = 2.0,
+    ):
+        self.path = path
+        self.resource = {"attributes": _attributes({"service.name": service_name})}
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._spans: queue.SimpleQueue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        self._spans.put(span)
+
+    def _drain(self, block: bool) -> List[Span]:
+        batch: List[Span] = []
+        try:
+            if block:
+                batch.append(self._spans.get(timeout=self.flush_interval))
+            while len(batch) < self.max_batch_size:
+                batch.append(self._spans.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: List[Span]):
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.to_otlp() for span in batch],
+                        }
+                    ],
+                }
+            ]
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(request, default=str) + "\n")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def shutdown(self):
+        """Stops the thread and writes whatever is still queued."""
+        self._stopped.set()
+        self._thread.join()
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+
+_exporter: Optional[OTLPJsonFileExporter] = None
+
+
+def configure_tracing(path: Optional[str], service_name: str = "autopm"):
+    """Exports spans to `path`; a falsy path turns tracing off."""
+    global _exporter
+    shutdown_tracing()
+    if path:
+        _exporter = OTLPJsonFileExporter(path, service_name)
+
+
+def shutdown_tracing():
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+atexit.register(shutdown_tracing)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """The W3C traceparent of the current span, to continue it elsewhere."""
+    current = _current.get()
+    return current.traceparent if current else None
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, traceparent: Optional[str] = None, **attributes):
+    """Runs the block in a new child of the current span, or of
+    `traceparent` if given. Exceptions are recorded and re-raised."""
+    if _exporter is None:
+        yield NOOP_SPAN
+        return
+    trace_id, parent_id = _parse_traceparent(traceparent)
+    if trace_id is None:
+        parent = _current.get()
+        trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        parent_id = parent.span_id if parent else None
+    new_span = Span(name, trace_id, parent_id, kind, attributes)
+    token = _current.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        new_span.end_ns = time.time_ns()
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(new_span)
+
+
+def traced(name: Optional[str] = None, kind: int = INTERNAL):
+    """Decorator running each call of a function in its own span."""
+
+    def decorate(function):
+        span_name = name or function.__qualname__
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind=kind):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind=kind):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
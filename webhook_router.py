@@ -0,0 +1,134 @@
+"""Declarative routing of Linear webhooks to handlers.
+
+Routes are declared with the event type(s), action(s) and changed fields
+(keys of `updatedFrom`) they care about, plus an optional predicate on the
+parsed payload. Before a payload is parsed, `might_match` checks the raw bytes
+for the tokens each route needs, so events no route can match are rejected
+without materializing any JSON.
+
+Synchronous handlers are meant to be cheap and run inline when the webhook
+arrives (e.g. cache invalidation); coroutine handlers are slow work meant to
+run in the background, see `run_async`.
+
+Example usage:
+
+    router = WebhookRouter()
+
+    @router.route(type="Comment", action="create")
+    async def handle_new_comment(payload):
+        ...
+
+    if router.might_match(body):
+        payload = json.loads(body)
+        router.run_inline(payload)
+        if router.has_async(payload):
+            await router.run_async(payload)
+"""
+import inspect
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Union
+
+import tracing
+
+Names = Union[str, Sequence[str]]
+
+
+def _names(value: Optional[Names]) -> Optional[tuple]:
+    if value is None:
+        return None
+    return (value,) if isinstance(value, str) else tuple(value)
+
+
+def _token(key: str, values: Iterable[str]) -> Pattern[bytes]:
+    alternatives = b"|".join(re.escape(v.encode()) for v in values)
+    return re.compile(rb'"' + key.encode() + rb'"\s*:\s*"(?:' + alternatives + rb')"')
+
+
+class Route:
+    def __init__(
+        self,
+        handler: Callable,
+        type: Optional[Names] = None,
+        action: Optional[Names] = None,
+        changed: Optional[Names] = None,
+        when: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ):
+        self.handler = handler
+        self.name = handler.__name__
+        self.type = _names(type)
+        self.action = _names(action)
+        self.changed = _names(changed)
+        self.when = when
+        self.is_async = inspect.iscoroutinefunction(handler)
+        # Tokens that must appear somewhere in the raw body for this route
+        # to possibly match.
+        self.tokens: List[Pattern[bytes]] = []
+        if self.type:
+            self.tokens.append(_token("type", self.type))
+        if self.action:
+            self.tokens.append(_token("action", self.action))
+        if self.changed:
+            alternatives = b"|".join(re.escape(c.encode()) for c in self.changed)
+            self.tokens.append(re.compile(rb'"(?:' + alternatives + rb')"\s*:'))
+
+    def might_match(self, body: bytes) -> bool:
+        return all(token.search(body) for token in self.tokens)
+
+    def matches(self, payload: Dict[str, Any]) -> bool:
+        if self.type and payload.get("type") not in self.type:
+            return False
+        if self.action and payload.get("action") not in self.action:
+            return False
+        if self.changed and not any(c in (payload.get("updatedFrom") or {}) for c in self.changed):
+            return False
+        return self.when is None or bool(self.when(payload))
+
+
+class WebhookRouter:
+    def __init__(self):
+        self.routes: List[Route] = []
+
+    def route(
+        self,
+        type: Optional[Names] = None,
+        action: Optional[Names] = None,
+        changed: Optional[Names] = None,
+        when: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ):
+        """Decorator registering a handler for matching events."""
+
+        def register(handler):
+            self.add(handler, type=type, action=action, changed=changed, when=when)
+            return handler
+
+        return register
+
+    def add(self, handler: Callable, **kwargs):
+        self.routes.append(Route(handler, **kwargs))
+
+    def might_match(self, body: bytes) -> bool:
+        """Cheap check on the raw body; False means no route can match."""
+        return any(route.might_match(body) for route in self.routes)
+
+    def match(self, payload: Dict[str, Any]) -> List[Route]:
+        return [route for route in self.routes if route.matches(payload)]
+
+    def has_async(self, payload: Dict[str, Any]) -> bool:
+        return any(route.is_async for route in self.match(payload))
+
+    def run_inline(self, payload: Dict[str, Any]):
+        """Runs the matching synchronous handlers."""
+        for route in self.match(payload):
+            if not route.is_async:
+                route.handler(payload)
+
+    async def run_async(self, payload: Dict[str, Any]) -> List[str]:
+        """Runs the matching coroutine handlers in registration order and
+        returns their names."""
+        ran = []
+        for route in self.match(payload):
+            if route.is_async:
+                with tracing.span(f"webhook handler {route.name}"):
+                    await route.handler(payload)
+                ran.append(route.name)
+        return ran